@@ -0,0 +1,334 @@
+"""Reproducible load benchmark for the finapp API.
+
+Seeds a throwaway database with a deterministic data set, drives the main
+workloads concurrently and writes latency percentiles, throughput and SQL
+statement counts per workload to a JSON file that can be compared between
+commits:
+
+    python -m benchmarks.run --users 20 --records 1000 --output before.json
+    python -m benchmarks.run --users 20 --records 1000 --compare before.json
+
+Pass --database-uri to run against a local Postgres instead of a temporary
+SQLite file, and --mode uvicorn to go through a real uvicorn server instead of
+the in-process ASGI transport. Statement counts are only available in-process.
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+
+WORDS = (
+    "uber bus fuel rent water power internet groceries market coffee lunch "
+    "dinner cinema concert books pharmacy gym salary bonus dividend gift refund"
+).split()
+
+WORKLOADS = ("register", "login", "list", "search", "summary", "create", "patch")
+
+current_workload = contextvars.ContextVar("current_workload", default=None)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-uri", default=None)
+    parser.add_argument("--mode", choices=["asgi", "uvicorn"], default="asgi")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--records", type=int, default=500, help="per user and kind")
+    parser.add_argument("--requests", type=int, default=200, help="per workload")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workloads", default=",".join(WORKLOADS))
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", default=None, help="previous results file")
+    return parser.parse_args()
+
+
+def seed(args: argparse.Namespace) -> dict[int, dict]:
+    from sqlalchemy import insert, select
+    from main import app  # noqa: F401 registers every model
+    from src import models, rollups, search
+    from src.dbconfig import Base, SessionLocal, engine
+    from src.helpers import PasswordHandler
+    from src.schemas import ExpenseCategory, IncomeSource
+
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        search.install(connection)
+
+    rng = random.Random(args.seed)
+    start = datetime(2023, 1, 1)
+    # one bcrypt hash shared by every seeded account keeps seeding fast
+    password = PasswordHandler.get_password_hash("benchmark")
+    with SessionLocal() as session:
+        session.execute(
+            insert(models.User),
+            [
+                {"username": f"user{i}", "fullname": f"User {i}", "password": password}
+                for i in range(args.users)
+            ],
+        )
+        user_ids = session.scalars(select(models.User.id)).all()
+        for user_id in user_ids:
+            for model, key, choices in (
+                (models.Expense, "category", list(ExpenseCategory)),
+                (models.Income, "source", list(IncomeSource)),
+            ):
+                session.execute(
+                    insert(model),
+                    [
+                        {
+                            "user_id": user_id,
+                            "date": start + timedelta(minutes=rng.randrange(10**6)),
+                            "amount": round(rng.uniform(1, 500), 2),
+                            "description": " ".join(rng.sample(WORDS, 3)),
+                            key: rng.choice(choices),
+                        }
+                        for _ in range(args.records)
+                    ],
+                )
+        session.commit()
+        rollups.rebuild(session)
+        expense_ids = defaultdict(list)
+        for expense_id, user_id in session.execute(
+            select(models.Expense.id, models.Expense.user_id)
+        ):
+            expense_ids[user_id].append(expense_id)
+    return {
+        user_id: {"username": f"user{i}", "expenses": expense_ids[user_id]}
+        for i, user_id in enumerate(user_ids)
+    }
+
+
+def count_statements() -> dict[str, int]:
+    from sqlalchemy import event
+    from src.dbconfig import async_engine, engine
+
+    counts = defaultdict(int)
+
+    def on_execute(*_):
+        workload = current_workload.get()
+        if workload is not None:
+            counts[workload] += 1
+
+    engines = [engine] + ([async_engine.sync_engine] if async_engine else [])
+    for target in engines:
+        event.listen(target, "before_cursor_execute", on_execute)
+    return counts
+
+
+def make_request(workload: str, rng: random.Random, users: dict, tokens: dict):
+    user_id = rng.choice(list(users))
+    headers = {"Authorization": f"Bearer {tokens[user_id]}"}
+    if workload == "register":
+        name = f"bench-{rng.getrandbits(64):x}"
+        body = {"username": name, "fullname": name, "password": "benchmark"}
+        return "POST", "/users/register", {"json": body}
+    if workload == "login":
+        form = {"username": users[user_id]["username"], "password": "benchmark"}
+        return "POST", "/users/token", {"data": form}
+    if workload == "list":
+        return "GET", "/expenses/", {"headers": headers, "params": {"limit": 50}}
+    if workload == "search":
+        params = {"query": rng.choice(WORDS)[:4], "limit": 50}
+        return "GET", "/expenses/", {"headers": headers, "params": params}
+    if workload == "summary":
+        return "GET", "/reports/summary", {"headers": headers}
+    if workload == "create":
+        body = {
+            "amount": round(rng.uniform(1, 500), 2),
+            "description": " ".join(rng.sample(WORDS, 3)),
+        }
+        return "POST", "/expenses/", {"headers": headers, "json": body}
+    expense_id = rng.choice(users[user_id]["expenses"])
+    body = {"amount": round(rng.uniform(1, 500), 2)}
+    return "PATCH", f"/expenses/{expense_id}", {"headers": headers, "json": body}
+
+
+async def run_workload(client, workload: str, args, users: dict, tokens: dict):
+    rng = random.Random(f"{args.seed}:{workload}")
+    plan = [make_request(workload, rng, users, tokens) for _ in range(args.requests)]
+    latencies, errors = [], 0
+    queue = iter(plan)
+
+    async def worker():
+        nonlocal errors
+        current_workload.set(workload)
+        for method, url, kwargs in queue:
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    ms = sorted(value * 1000 for value in latencies)
+    cuts = (
+        statistics.quantiles(ms, n=100, method="inclusive") if len(ms) > 1 else ms * 99
+    )
+    return {
+        "requests": len(ms),
+        "errors": errors,
+        "rps": round(len(ms) / elapsed, 2),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "p50_ms": round(cuts[49], 3),
+        "p95_ms": round(cuts[94], 3),
+        "p99_ms": round(cuts[98], 3),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+async def drive(args, users: dict) -> dict:
+    import httpx
+    from src.helpers import TokenHandler
+
+    # tokens are minted directly so only the login workload pays for bcrypt
+    tokens = {
+        user_id: TokenHandler.create_access_token(data={"sub": user["username"]})
+        for user_id, user in users.items()
+    }
+    server = None
+    statements = None
+    if args.mode == "asgi":
+        from main import app
+
+        statements = count_statements()
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://benchmark"
+    else:
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+            env=os.environ.copy(),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        transport = httpx.AsyncHTTPTransport()
+        base_url = f"http://127.0.0.1:{port}"
+
+    results = {}
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(
+            transport=transport, base_url=base_url, timeout=60, limits=limits
+        ) as client:
+            if server is not None:
+                for _ in range(100):
+                    try:
+                        await client.get("/docs")
+                        break
+                    except httpx.TransportError:
+                        await asyncio.sleep(0.1)
+            for workload in args.workloads.split(","):
+                latencies, errors, elapsed = await run_workload(
+                    client, workload, args, users, tokens
+                )
+                results[workload] = summarize(latencies, errors, elapsed)
+                results[workload]["statements_per_request"] = (
+                    round(statements[workload] / len(latencies), 2)
+                    if statements is not None
+                    else None
+                )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    return results
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(results: dict, previous: dict | None) -> None:
+    header = f"{'workload':<10}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}"
+    print(header + f"{'sql/req':>10}{'errors':>8}")
+    for workload, row in results.items():
+        print(
+            f"{workload:<10}{row['rps']:>10}{row['p50_ms']:>10}{row['p95_ms']:>10}"
+            f"{row['p99_ms']:>10}{str(row['statements_per_request']):>10}"
+            f"{row['errors']:>8}"
+        )
+        before = (previous or {}).get(workload)
+        if before:
+            deltas = ", ".join(
+                f"{key} {100 * (row[key] - before[key]) / before[key]:+.1f}%"
+                for key in ("rps", "p50_ms", "p95_ms", "p99_ms")
+                if before[key]
+            )
+            print(f"{'':<10}vs previous: {deltas}")
+
+
+def main() -> None:
+    args = parse_args()
+    scratch = None
+    if args.database_uri is None:
+        # a directory, so the WAL and shared-memory files go with the database
+        scratch = tempfile.TemporaryDirectory(prefix="finapp-bench-")
+        args.database_uri = f"sqlite:///{os.path.join(scratch.name, 'bench.db')}"
+    # the app reads its configuration at import time
+    os.environ["DATABASE_URI"] = args.database_uri
+    # the workloads would otherwise mostly time the rate limiter's 429s
+    os.environ["RATE_LIMIT_ENABLED"] = "false"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    try:
+        users = seed(args)
+        results = asyncio.run(drive(args, users))
+    finally:
+        from src.dbconfig import engine
+
+        engine.dispose()
+        if scratch is not None:
+            scratch.cleanup()
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as handle:
+            previous = json.load(handle)["results"]
+    report(results, previous)
+    meta = {
+        "revision": git_revision(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "mode": args.mode,
+        "database": args.database_uri.split(":", 1)[0],
+        "users": args.users,
+        "records": args.records,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "seed": args.seed,
+    }
+    with open(args.output, "w") as handle:
+        json.dump({"meta": meta, "results": results}, handle, indent=2)
+    failed = [workload for workload, row in results.items() if row["errors"]]
+    if failed:
+        sys.exit(f"requests failed in: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,22 @@
 from contextlib import _AsyncGeneratorContextManager, asynccontextmanager
-from fastapi import FastAPI
-from fastapi.responses import RedirectResponse
-from src.dbconfig import Base, engine
+import logging
+import time
+from decouple import config
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse
+from src import fx, jobs, metrics, ratelimit, recurring, search
+from src.dbconfig import Base, SessionLocal, async_engine, engine, pool_status
 import uvicorn
-from src.routers import expense_routers, income_routers, user_router
+from src.routers import (
+    expense_routers,
+    income_routers,
+    job_routers,
+    report_routers,
+    user_router,
+)
+
+
+logger = logging.getLogger("uvicorn.error")
 
 
 @asynccontextmanager
@@ -11,11 +24,26 @@ async def lifespan(app: FastAPI) -> _AsyncGeneratorContextManager[None]:
     # Create the tables in the database
     # on app start up.
     Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        search.install(connection)
+    if fx.FX_RATES_CSV:
+        with SessionLocal() as session:
+            logger.info("fx rates: loaded %s", fx.load(session, fx.FX_RATES_CSV))
+    logger.info("database pool: %s", pool_status(engine))
+    if async_engine is not None:
+        logger.info("async database pool: %s", pool_status(async_engine.sync_engine))
+    await jobs.start()
+    await recurring.start()
     yield
     # clean up code after shutdown goes here
+    await recurring.stop()
+    await jobs.stop()
+    if async_engine is not None:
+        await async_engine.dispose()
 
 
-app = FastAPI(lifespan=lifespan)
+# every route spends its cost from the caller's rate limit bucket
+app = FastAPI(lifespan=lifespan, dependencies=[Depends(ratelimit.enforce)])
 
 
 @app.get("/", tags=["Root"])
@@ -23,6 +51,58 @@ async def root() -> RedirectResponse:
     return RedirectResponse(url="/docs")
 
 
+@app.get("/metrics", tags=["Root"], response_class=PlainTextResponse)
+async def prometheus_metrics() -> PlainTextResponse:
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+# registered before the metrics middleware so that one wraps it and counts
+# the shed requests too
+@app.middleware("http")
+async def shed_load(request: Request, call_next):
+    if not ratelimit.in_flight.acquire():
+        metrics.requests_rejected.inc(reason="overload", route="any")
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Server is busy, retry shortly"},
+            headers={"Retry-After": str(ratelimit.SHED_RETRY_AFTER)},
+        )
+    try:
+        return await call_next(request)
+    finally:
+        ratelimit.in_flight.release()
+
+
+SERVER_TIMING = config("SERVER_TIMING", default=False, cast=bool)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    stats = metrics.RequestStats()
+    token = metrics.current_request.set(stats)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        metrics.current_request.reset(token)
+    elapsed = time.perf_counter() - started
+    # label by route template so path parameters don't explode cardinality
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    metrics.request_duration.observe(
+        elapsed, method=request.method, route=route, status=response.status_code
+    )
+    metrics.request_statements.observe(stats.statements, route=route)
+    metrics.request_db_time.observe(stats.db_seconds, route=route)
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = (
+            f"db;dur={stats.db_seconds * 1000:.2f};desc={stats.statements}, "
+            f"app;dur={elapsed * 1000:.2f}"
+        )
+    return response
+
+
 app.include_router(router=user_router.router)
 
 # Expense Records routes
@@ -31,6 +111,12 @@ app.include_router(router=expense_routers.router)
 # Income Records routes
 app.include_router(router=income_routers.router)
 
+# Reports routes
+app.include_router(router=report_routers.router)
+
+# Background jobs routes
+app.include_router(router=job_routers.router)
+
 
 if __name__ == "__main__":
     uvicorn.run(app="main:app", host="localhost", port=8000, reload=True)
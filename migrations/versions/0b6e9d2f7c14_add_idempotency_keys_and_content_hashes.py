@@ -0,0 +1,44 @@
+"""add idempotency keys and record content hashes
+
+Revision ID: 0b6e9d2f7c14
+Revises: f1d83a6c0b57
+Create Date: 2026-10-18 19:02:47.331590
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b6e9d2f7c14'
+down_revision: Union[str, None] = 'f1d83a6c0b57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('idempotency_keys',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('key', sa.String(), nullable=False),
+    sa.Column('fingerprint', sa.String(), nullable=False),
+    sa.Column('status_code', sa.Integer(), nullable=True),
+    sa.Column('response', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'key', name='uq_idempotency_keys_user_key')
+    )
+    for table in ('expenses', 'incomes'):
+        op.add_column(table, sa.Column('content_hash', sa.String(), nullable=True))
+        op.create_index(f'ix_{table}_user_id_content_hash', table, ['user_id', 'content_hash'], unique=False)
+    # hash existing records with: python -m src.idempotency backfill
+
+
+def downgrade() -> None:
+    for table in ('incomes', 'expenses'):
+        op.drop_index(f'ix_{table}_user_id_content_hash', table_name=table)
+        op.drop_column(table, 'content_hash')
+    op.drop_table('idempotency_keys')
@@ -0,0 +1,51 @@
+"""add background jobs
+
+Revision ID: 3c7a2e91d4f6
+Revises: 0b6e9d2f7c14
+Create Date: 2026-10-18 19:48:05.117402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c7a2e91d4f6'
+down_revision: Union[str, None] = '0b6e9d2f7c14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('jobs',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.Enum('EXPENSE_IMPORT', 'INCOME_IMPORT', 'EXPENSE_EXPORT', 'INCOME_EXPORT', 'ROLLUP_REBUILD', name='jobkind'), nullable=False),
+    sa.Column('status', sa.Enum('QUEUED', 'RUNNING', 'SUCCEEDED', 'FAILED', 'CANCELLED', name='jobstatus'), nullable=False),
+    sa.Column('params', sa.String(), nullable=False),
+    sa.Column('result', sa.String(), nullable=True),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('processed', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=True),
+    sa.Column('checkpoint', sa.Integer(), nullable=False),
+    sa.Column('cancel_requested', sa.Boolean(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_jobs_status_id', 'jobs', ['status', 'id'], unique=False)
+    op.create_index('ix_jobs_user_id_id', 'jobs', ['user_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_jobs_user_id_id', table_name='jobs')
+    op.drop_index('ix_jobs_status_id', table_name='jobs')
+    op.drop_table('jobs')
+    sa.Enum(name='jobstatus').drop(op.get_bind(), checkfirst=True)
+    sa.Enum(name='jobkind').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,70 @@
+"""add recurring rules
+
+Revision ID: 5e9b1c7d2a48
+Revises: 8d2f5b3a6e19
+Create Date: 2026-10-18 23:12:41.503817
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e9b1c7d2a48'
+down_revision: Union[str, None] = '8d2f5b3a6e19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('recurring_expenses',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=18, scale=4), nullable=False),
+    sa.Column('currency', sa.String(length=3), nullable=False),
+    sa.Column('description', sa.String(), nullable=False),
+    sa.Column('category', postgresql.ENUM('FOODSTUFF', 'UTILITY', 'ENTERTAINMENT', 'TRANSPORT', 'OTHER', name='expensecategory', create_type=False), nullable=False),
+    sa.Column('frequency', sa.Enum('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY', name='frequency'), nullable=False),
+    sa.Column('interval', sa.Integer(), nullable=False),
+    sa.Column('starts_at', sa.DateTime(), nullable=False),
+    sa.Column('until', sa.DateTime(), nullable=True),
+    sa.Column('count', sa.Integer(), nullable=True),
+    sa.Column('materialized', sa.Integer(), nullable=False),
+    sa.Column('next_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_recurring_expenses_next_at', 'recurring_expenses', ['next_at'], unique=False)
+    op.create_index('ix_recurring_expenses_user_id_id', 'recurring_expenses', ['user_id', 'id'], unique=False)
+    op.create_table('recurring_incomes',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=18, scale=4), nullable=False),
+    sa.Column('currency', sa.String(length=3), nullable=False),
+    sa.Column('description', sa.String(), nullable=False),
+    sa.Column('source', postgresql.ENUM('SALARY', 'FREELANCE', 'INVESTMENT', 'GIFT', 'OTHER', name='incomesource', create_type=False), nullable=False),
+    sa.Column('frequency', postgresql.ENUM('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY', name='frequency', create_type=False), nullable=False),
+    sa.Column('interval', sa.Integer(), nullable=False),
+    sa.Column('starts_at', sa.DateTime(), nullable=False),
+    sa.Column('until', sa.DateTime(), nullable=True),
+    sa.Column('count', sa.Integer(), nullable=True),
+    sa.Column('materialized', sa.Integer(), nullable=False),
+    sa.Column('next_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_recurring_incomes_next_at', 'recurring_incomes', ['next_at'], unique=False)
+    op.create_index('ix_recurring_incomes_user_id_id', 'recurring_incomes', ['user_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_recurring_incomes_user_id_id', table_name='recurring_incomes')
+    op.drop_index('ix_recurring_incomes_next_at', table_name='recurring_incomes')
+    op.drop_table('recurring_incomes')
+    op.drop_index('ix_recurring_expenses_user_id_id', table_name='recurring_expenses')
+    op.drop_index('ix_recurring_expenses_next_at', table_name='recurring_expenses')
+    op.drop_table('recurring_expenses')
+    sa.Enum(name='frequency').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,28 @@
+"""add user/date/id indexes for keyset pagination
+
+Revision ID: 7c3f1d9b2e4a
+Revises: 2a5ec6e8c921
+Create Date: 2026-10-18 09:12:31.402118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c3f1d9b2e4a'
+down_revision: Union[str, None] = '2a5ec6e8c921'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_expenses_user_id_date_id', 'expenses', ['user_id', 'date', 'id'], unique=False)
+    op.create_index('ix_incomes_user_id_date_id', 'incomes', ['user_id', 'date', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_incomes_user_id_date_id', table_name='incomes')
+    op.drop_index('ix_expenses_user_id_date_id', table_name='expenses')
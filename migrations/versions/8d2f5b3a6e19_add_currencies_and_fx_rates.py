@@ -0,0 +1,71 @@
+"""add record currencies, exact amounts and fx rates
+
+Revision ID: 8d2f5b3a6e19
+Revises: 3c7a2e91d4f6
+Create Date: 2026-10-18 20:36:41.502993
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from decouple import config
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2f5b3a6e19'
+down_revision: Union[str, None] = '3c7a2e91d4f6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# existing records and rollups are in the base currency
+BASE_CURRENCY = config('BASE_CURRENCY', default='USD')
+ROLLUPS = (('expense_rollups', 'category'), ('income_rollups', 'source'))
+
+
+def upgrade() -> None:
+    sqlite = op.get_bind().dialect.name == 'sqlite'
+    for table in ('expenses', 'incomes'):
+        op.add_column(table, sa.Column('currency', sa.String(length=3), nullable=False, server_default=BASE_CURRENCY))
+        # sqlite stores values whatever the declared type, and the table copy
+        # a batch alter makes there would drop the full-text triggers. It has
+        # no exact decimal storage either: Numeric columns hold REAL values
+        # there, so amounts and database-side sums on sqlite are still binary
+        # floats, only rounded back to the declared scale when read
+        if not sqlite:
+            op.alter_column(table, 'amount', existing_type=sa.Float(), type_=sa.Numeric(precision=18, scale=4), existing_nullable=False)
+    for table, key in ROLLUPS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('currency', sa.String(length=3), nullable=False, server_default=BASE_CURRENCY))
+            batch_op.alter_column('total', existing_type=sa.Float(), type_=sa.Numeric(precision=18, scale=4), existing_nullable=False)
+            batch_op.alter_column('min', existing_type=sa.Float(), type_=sa.Numeric(precision=18, scale=4), existing_nullable=True)
+            batch_op.alter_column('max', existing_type=sa.Float(), type_=sa.Numeric(precision=18, scale=4), existing_nullable=True)
+            batch_op.drop_constraint(f'uq_{table}_bucket', type_='unique')
+            batch_op.create_unique_constraint(f'uq_{table}_bucket', ['user_id', 'month', key, 'currency'])
+    op.create_table('fx_rates',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('currency', sa.String(length=3), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('rate', sa.Numeric(precision=18, scale=8), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('currency', 'date', name='uq_fx_rates_currency_date')
+    )
+
+
+def downgrade() -> None:
+    sqlite = op.get_bind().dialect.name == 'sqlite'
+    op.drop_table('fx_rates')
+    for table, key in ROLLUPS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_constraint(f'uq_{table}_bucket', type_='unique')
+            batch_op.create_unique_constraint(f'uq_{table}_bucket', ['user_id', 'month', key])
+            batch_op.alter_column('max', existing_type=sa.Numeric(precision=18, scale=4), type_=sa.Float(), existing_nullable=True)
+            batch_op.alter_column('min', existing_type=sa.Numeric(precision=18, scale=4), type_=sa.Float(), existing_nullable=True)
+            batch_op.alter_column('total', existing_type=sa.Numeric(precision=18, scale=4), type_=sa.Float(), existing_nullable=False)
+            batch_op.drop_column('currency')
+    for table in ('incomes', 'expenses'):
+        if not sqlite:
+            op.alter_column(table, 'amount', existing_type=sa.Numeric(precision=18, scale=4), type_=sa.Float(), existing_nullable=False)
+        op.drop_column(table, 'currency')
+    # rollups of several currencies per bucket can't be merged back here, run
+    # python -m src.rollups rebuild after downgrading
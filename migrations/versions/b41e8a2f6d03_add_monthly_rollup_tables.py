@@ -0,0 +1,55 @@
+"""add monthly rollup tables
+
+Revision ID: b41e8a2f6d03
+Revises: 7c3f1d9b2e4a
+Create Date: 2026-10-18 11:40:07.215634
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b41e8a2f6d03'
+down_revision: Union[str, None] = '7c3f1d9b2e4a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # the enum types already exist from the first migration
+    op.create_table('expense_rollups',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('category', postgresql.ENUM('FOODSTUFF', 'UTILITY', 'ENTERTAINMENT', 'TRANSPORT', 'OTHER', name='expensecategory', create_type=False), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('min', sa.Float(), nullable=True),
+    sa.Column('max', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'month', 'category', name='uq_expense_rollups_bucket')
+    )
+    op.create_table('income_rollups',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('source', postgresql.ENUM('SALARY', 'FREELANCE', 'INVESTMENT', 'GIFT', 'OTHER', name='incomesource', create_type=False), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('min', sa.Float(), nullable=True),
+    sa.Column('max', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'month', 'source', name='uq_income_rollups_bucket')
+    )
+    # backfill existing records with: python -m src.rollups rebuild
+
+
+def downgrade() -> None:
+    op.drop_table('income_rollups')
+    op.drop_table('expense_rollups')
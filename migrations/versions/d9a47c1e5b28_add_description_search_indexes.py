@@ -0,0 +1,53 @@
+"""add description full-text search indexes
+
+Revision ID: d9a47c1e5b28
+Revises: b41e8a2f6d03
+Create Date: 2026-10-18 14:22:51.837402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9a47c1e5b28'
+down_revision: Union[str, None] = 'b41e8a2f6d03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TABLES = ('expenses', 'incomes')
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    for table in TABLES:
+        if dialect == 'sqlite':
+            # external-content FTS5 index kept in sync by triggers
+            op.execute(f"CREATE VIRTUAL TABLE {table}_fts USING fts5(description, content='{table}', content_rowid='id')")
+            op.execute(f"""CREATE TRIGGER {table}_fts_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {table}_fts(rowid, description) VALUES (new.id, new.description);
+            END""")
+            op.execute(f"""CREATE TRIGGER {table}_fts_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {table}_fts({table}_fts, rowid, description) VALUES ('delete', old.id, old.description);
+            END""")
+            op.execute(f"""CREATE TRIGGER {table}_fts_update AFTER UPDATE OF description ON {table} BEGIN
+                INSERT INTO {table}_fts({table}_fts, rowid, description) VALUES ('delete', old.id, old.description);
+                INSERT INTO {table}_fts(rowid, description) VALUES (new.id, new.description);
+            END""")
+            op.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+        elif dialect == 'postgresql':
+            op.execute(f"CREATE INDEX ix_{table}_description_fts ON {table} USING gin (to_tsvector('simple', description))")
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    for table in TABLES:
+        if dialect == 'sqlite':
+            for trigger in ('insert', 'delete', 'update'):
+                op.execute(f"DROP TRIGGER IF EXISTS {table}_fts_{trigger}")
+            op.execute(f"DROP TABLE IF EXISTS {table}_fts")
+        elif dialect == 'postgresql':
+            op.execute(f"DROP INDEX IF EXISTS ix_{table}_description_fts")
@@ -0,0 +1,35 @@
+"""add collection versions
+
+Revision ID: e5c20b7f4a91
+Revises: d9a47c1e5b28
+Create Date: 2026-10-18 18:31:12.604318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5c20b7f4a91'
+down_revision: Union[str, None] = 'd9a47c1e5b28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('collection_versions',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('collection', sa.String(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'collection', name='uq_collection_versions_user_collection')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('collection_versions')
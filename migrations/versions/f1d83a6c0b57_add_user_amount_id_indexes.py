@@ -0,0 +1,29 @@
+"""add user/amount/id indexes for amount filters and ordering
+
+Revision ID: f1d83a6c0b57
+Revises: e5c20b7f4a91
+Create Date: 2026-10-18 18:44:05.918273
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1d83a6c0b57'
+down_revision: Union[str, None] = 'e5c20b7f4a91'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # date ranges already use ix_*_user_id_date_id from 7c3f1d9b2e4a
+    op.create_index('ix_expenses_user_id_amount_id', 'expenses', ['user_id', 'amount', 'id'], unique=False)
+    op.create_index('ix_incomes_user_id_amount_id', 'incomes', ['user_id', 'amount', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_incomes_user_id_amount_id', table_name='incomes')
+    op.drop_index('ix_expenses_user_id_amount_id', table_name='expenses')
@@ -0,0 +1,121 @@
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from decouple import config
+from starlette.concurrency import run_in_threadpool
+
+
+# values are JSON-serialisable dicts so every backend can store them as-is.
+# The *_async variants are for the event loop: a blocking backend's calls go
+# through the threadpool there, in-memory ones run inline
+class CacheBackend(ABC):
+    blocking = False
+
+    @abstractmethod
+    def get(self, key: str) -> dict | None: ...
+
+    @abstractmethod
+    def set(self, key: str, value: dict, ttl: float) -> None: ...
+
+    @abstractmethod
+    def delete(self, *keys: str) -> None: ...
+
+    @abstractmethod
+    def clear(self) -> None: ...
+
+    async def _call(self, method, *args):
+        if self.blocking:
+            return await run_in_threadpool(method, *args)
+        return method(*args)
+
+    async def get_async(self, key: str) -> dict | None:
+        return await self._call(self.get, key)
+
+    async def set_async(self, key: str, value: dict, ttl: float) -> None:
+        await self._call(self.set, key, value, ttl)
+
+    async def delete_async(self, *keys: str) -> None:
+        await self._call(self.delete, *keys)
+
+
+# per-process TTL + LRU cache, also the stand-in for a shared backend in tests
+class MemoryCache(CacheBackend):
+    def __init__(self, maxsize: int = 10_000):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        # sync handlers and crud code run in the threadpool
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: dict, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# shared between workers, so an invalidation reaches all of them
+class RedisCache(CacheBackend):
+    blocking = True
+
+    def __init__(self, url: str, prefix: str):
+        # only needed when CACHE_URL is configured
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key: str) -> dict | None:
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, value: dict, ttl: float) -> None:
+        self.client.set(self.prefix + key, json.dumps(value), px=int(ttl * 1000))
+
+    def delete(self, *keys: str) -> None:
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+    def clear(self) -> None:
+        for key in self.client.scan_iter(match=self.prefix + "*"):
+            self.client.delete(key)
+
+
+CACHE_URL = config("CACHE_URL", default=None)
+
+
+def build_cache(namespace: str, maxsize: int) -> CacheBackend:
+    if CACHE_URL:
+        return RedisCache(CACHE_URL, prefix=f"finapp:{namespace}:")
+    return MemoryCache(maxsize=maxsize)
+
+
+USER_CACHE_TTL = config("USER_CACHE_TTL", default=60, cast=float)
+
+# resolved UserRead payloads keyed by username
+user_cache = build_cache(
+    "user", maxsize=config("USER_CACHE_SIZE", default=10_000, cast=int)
+)
@@ -0,0 +1,59 @@
+import hashlib
+from datetime import timezone
+from email.utils import format_datetime
+from fastapi import Request, Response, status
+from src import fx, versions
+from src.dbconfig import DBSession
+from src.schemas import UserRead
+
+
+def _etag(request: Request, user: UserRead, version: str) -> str:
+    # the version covers the data, the path and query cover which slice
+    # of it the response holds
+    query = sorted(request.query_params.multi_items())
+    key = f"{user.id}:{version}:{request.url.path}:{query}"
+    return '"' + hashlib.sha256(key.encode()).hexdigest()[:32] + '"'
+
+
+def _matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def _current(session, model, user: UserRead, converted: bool) -> tuple:
+    version, updated_at = versions.current(session, model, user.id)
+    if converted:
+        # converted amounts also change when the rate table does
+        version = f"{version}:{fx.rates(session).revision}"
+    return version, updated_at
+
+
+async def not_modified(
+    request: Request,
+    response: Response,
+    db: DBSession,
+    user: UserRead,
+    model,
+    converted: bool = False,
+) -> Response | None:
+    # answers with a 304 when the client's copy is current, without running
+    # the handler's query; otherwise sets the validators on the response
+    version, updated_at = await db.run_sync(
+        lambda session: _current(session, model, user, converted)
+    )
+    headers = {
+        "ETag": _etag(request, user, version),
+        "Cache-Control": "private, no-cache",
+        "Vary": "Authorization",
+    }
+    if updated_at is not None:
+        headers["Last-Modified"] = format_datetime(
+            updated_at.replace(tzinfo=timezone.utc), usegmt=True
+        )
+    if _matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -1,39 +1,417 @@
-from src import schemas, models
-from fastapi.encoders import jsonable_encoder
-from sqlalchemy.orm import Session
-from sqlalchemy import types, or_ as _or
+import time
+from collections import defaultdict
+from datetime import date, datetime
+from itertools import chain
+from decimal import Decimal
+from typing import Iterable, Iterator
+from pydantic import BaseModel, ValidationError
+from src import (
+    fx,
+    idempotency,
+    schemas,
+    models,
+    recurring,
+    rollups,
+    search as search_index,
+    versions,
+)
+from src.cache import user_cache
+from src.dbconfig import SessionLocal, read_engine
+from src.export import ENCODERS
+from src.ingest import RowParseError
+from src.pagination import DEFAULT_PAGE_SIZE, encode_cursor, decode_cursor
+from sqlalchemy.orm import Session, Query
+from sqlalchemy import bindparam, delete, func, insert, select, tuple_, update
 from fastapi import status, HTTPException
 
+# columns of the read schemas; listings select these instead of entities so
+# rows go straight to serialization without building ORM objects
+EXPENSE_COLUMNS = [
+    models.Expense.id,
+    models.Expense.date,
+    models.Expense.amount,
+    models.Expense.currency,
+    models.Expense.description,
+    models.Expense.category,
+]
+INCOME_COLUMNS = [
+    models.Income.id,
+    models.Income.date,
+    models.Income.amount,
+    models.Income.currency,
+    models.Income.description,
+    models.Income.source,
+]
+USER_COLUMNS = [
+    models.User.id,
+    models.User.username,
+    models.User.fullname,
+    models.User.disabled,
+]
+# usernames per UPDATE, well under every driver's bound parameter limit
+USER_BATCH_SIZE = 1000
+
+
+def _project(columns: list, fields: tuple[str, ...] | None) -> list:
+    # only the requested columns are read and sent, the sort keys needed for
+    # the cursor are selected separately by _paginate
+    if not fields:
+        return columns
+    return [column for column in columns if column.key in fields]
+
+
+def _project_for_display(
+    columns: list, fields: tuple[str, ...] | None, currency: str | None
+) -> list:
+    # converting an amount needs the record's own currency and date too
+    if currency and fields and "amount" in fields:
+        fields = fields + ("currency", "date")
+    return _project(columns, fields)
+
+
+def _in_currency(items: list, currency: str | None, db: Session) -> list:
+    if currency is None:
+        return items
+    return fx.convert(items, currency, fx.rates(db))
+
+
+def _paginate(
+    query: Query,
+    keys: list[tuple],
+    limit: int,
+    cursor: str | None,
+    descending: bool = True,
+) -> dict:
+    # keyset pagination over the (expression, python type) sort keys, e.g.
+    # (date, id): the seek predicate lets the (user_id, date, id) index jump
+    # straight to the page instead of scanning past every row before it as
+    # OFFSET would. The keys are selected too so the cursor can be built,
+    # labelled so they don't shadow the item columns on the result rows.
+    columns = [key for key, _ in keys]
+    if cursor:
+        after = decode_cursor(cursor, [kind for _, kind in keys])
+        seek = tuple_(*columns) < after if descending else tuple_(*columns) > after
+        query = query.filter(seek)
+    order = [key.desc() if descending else key.asc() for key in columns]
+    labelled = [key.label(f"cursor_{index}") for index, key in enumerate(columns)]
+    rows = query.add_columns(*labelled).order_by(*order).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(*rows[-1][-len(columns) :])
+    return {"items": rows, "next_cursor": next_cursor}
+
+
+def _search(
+    query: Query,
+    model,
+    db: Session,
+    search: str | None,
+    sort: schemas.ListSort,
+    limit: int,
+    cursor: str | None,
+) -> dict:
+    if search:
+        query, rank = search_index.apply(
+            query, model, search, db.get_bind().dialect.name
+        )
+        if sort == schemas.ListSort.RELEVANCE and rank is not None:
+            return _paginate(
+                query, [(rank, float), (model.id, int)], limit, cursor, descending=False
+            )
+    # relevance without a search term falls back to newest first
+    if sort in (schemas.ListSort.AMOUNT, schemas.ListSort.AMOUNT_ASC):
+        keys = [(model.amount, Decimal), (model.id, int)]
+    else:
+        keys = [(model.date, datetime), (model.id, int)]
+    descending = sort not in (schemas.ListSort.DATE_ASC, schemas.ListSort.AMOUNT_ASC)
+    return _paginate(query, keys, limit, cursor, descending)
+
+
+def _criteria(
+    model, key, values: list | None, ranges: schemas.RangeFilter | None
+) -> list:
+    # every bound is a range on a leading column of one of the (user_id,
+    # date, id) and (user_id, amount, id) indexes after the user filter
+    criteria = []
+    if values:
+        criteria.append(key.in_(values))
+    if ranges is None:
+        return criteria
+    if ranges.date_from is not None:
+        criteria.append(model.date >= ranges.date_from)
+    if ranges.date_to is not None:
+        criteria.append(model.date < ranges.date_to)
+    if ranges.min_amount is not None:
+        criteria.append(model.amount >= ranges.min_amount)
+    if ranges.max_amount is not None:
+        criteria.append(model.amount <= ranges.max_amount)
+    return criteria
+
+
+def _batch_criteria(
+    model, key: str, user: schemas.UserRead, batch_filter: schemas.BatchFilter
+) -> list:
+    criteria = [model.user_id == user.id]
+    criteria += _criteria(
+        model, getattr(model, key), getattr(batch_filter, key), batch_filter
+    )
+    if batch_filter.ids is not None:
+        criteria.append(model.id.in_(batch_filter.ids))
+    if batch_filter.description_contains:
+        criteria.append(model.description.icontains(batch_filter.description_contains))
+    return criteria
+
+
+def _batch_update(
+    model, key: str, batch, db: Session, user: schemas.UserRead
+) -> schemas.BatchResult:
+    # a filter update is one UPDATE statement; per-record patches are one
+    # executemany per distinct set of patched fields. Rollup buckets in the
+    # touched months are recomputed once at the end rather than per row.
+    rollup_fields = {"amount", "currency", key}
+    hashed_fields = {"amount", "currency", "description"}
+    if batch.filter is not None:
+        values = batch.set.model_dump(exclude_unset=True, exclude_none=True)
+        fx.require_rate(db, values.get("currency"))
+        if hashed_fields & values.keys():
+            # left for `python -m src.idempotency backfill` to recompute
+            values["content_hash"] = None
+        criteria = _batch_criteria(model, key, user, batch.filter)
+        months = set()
+        if rollup_fields & values.keys():
+            months = rollups.months_of(db, model, criteria)
+        matched = affected = 0
+        if values:
+            matched = affected = db.execute(
+                update(model)
+                .where(*criteria)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+    else:
+        patches = {
+            patch.id: patch.model_dump(
+                exclude_unset=True, exclude_none=True, exclude={"id"}
+            )
+            for patch in batch.updates
+        }
+        fx.require_rate(db, *(values.get("currency") for values in patches.values()))
+        criteria = [model.user_id == user.id, model.id.in_(patches)]
+        owned = db.scalars(select(model.id).where(*criteria)).all()
+        months = set()
+        if any(rollup_fields & patches[record_id].keys() for record_id in owned):
+            months = rollups.months_of(db, model, criteria)
+        groups = defaultdict(list)
+        for record_id in owned:
+            values = patches[record_id]
+            if hashed_fields & values.keys():
+                values["content_hash"] = None
+            if values:
+                groups[tuple(sorted(values))].append(
+                    {"record_id": record_id}
+                    | {f"new_{name}": value for name, value in values.items()}
+                )
+        table = model.__table__
+        for fields, rows in groups.items():
+            db.execute(
+                update(table)
+                .where(table.c.id == bindparam("record_id"))
+                .values({name: bindparam(f"new_{name}") for name in fields}),
+                rows,
+            )
+        matched, affected = len(owned), sum(len(rows) for rows in groups.values())
+    rollups.refresh(db, model, user.id, months)
+    if affected:
+        versions.bump(db, model, user.id)
+    db.commit()
+    return {"matched": matched, "affected": affected}
+
+
+def _batch_delete(
+    model,
+    key: str,
+    batch_filter: schemas.BatchFilter,
+    db: Session,
+    user: schemas.UserRead,
+) -> schemas.BatchResult:
+    criteria = _batch_criteria(model, key, user, batch_filter)
+    months = rollups.months_of(db, model, criteria)
+    deleted = db.execute(
+        delete(model).where(*criteria).execution_options(synchronize_session=False)
+    ).rowcount
+    rollups.refresh(db, model, user.id, months)
+    if deleted:
+        versions.bump(db, model, user.id)
+    db.commit()
+    return {"matched": deleted, "affected": deleted}
+
+
+def _export(
+    model, columns: list, user: schemas.UserRead, fmt: schemas.ExportFormat
+) -> Iterator[str]:
+    # the export outlives the request handler, so it owns its session and
+    # pulls plain row tuples through a server-side cursor in fixed batches.
+    statement = (
+        select(*columns)
+        .where(model.user_id == user.id)
+        .order_by(model.date, model.id)
+        .execution_options(stream_results=True, yield_per=1000)
+    )
+    with SessionLocal(bind=read_engine(user.username)) as session:
+        rows = session.execute(statement)
+        yield from ENCODERS[fmt]([column.key for column in columns], rows)
+
+
+def _describe_error(error: ValueError) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(map(str, e['loc'])) or 'row'}: {e['msg']}"
+            for e in error.errors()
+        )
+    return str(error)
+
+
+def _bulk_insert(
+    model,
+    schema: type[BaseModel],
+    records: Iterable[dict | RowParseError],
+    db: Session,
+    user: schemas.UserRead,
+    batch_size: int,
+    dedupe: bool = False,
+) -> schemas.BulkResult:
+    # rows are validated as they stream in and flushed as one multi-row
+    # INSERT per batch; a single commit at the end keeps the import atomic.
+    # With dedupe, rows whose content hash is already stored for the user,
+    # or was seen earlier in the same import, are skipped.
+    started = time.perf_counter()
+    inserted, duplicates, errors, batch = 0, 0, [], []
+    table = fx.rates(db)
+    seen = set()
+
+    def flush(batch: list[dict]) -> None:
+        nonlocal inserted, duplicates
+        if dedupe:
+            stored = set(
+                db.scalars(
+                    select(model.content_hash).where(
+                        model.user_id == user.id,
+                        model.content_hash.in_({row["content_hash"] for row in batch}),
+                    )
+                )
+            )
+            fresh = []
+            for values in batch:
+                if values["content_hash"] in stored or values["content_hash"] in seen:
+                    duplicates += 1
+                    continue
+                seen.add(values["content_hash"])
+                fresh.append(values)
+            batch = fresh
+        if batch:
+            db.execute(insert(model), batch)
+            rollups.add_many(db, model, user.id, batch)
+            inserted += len(batch)
+
+    for row, record in enumerate(records, start=1):
+        try:
+            if isinstance(record, RowParseError):
+                raise record
+            values = schema.model_validate(record).model_dump()
+            if not table.known(values["currency"]):
+                raise ValueError(f"no exchange rate is loaded for {values['currency']}")
+        except ValueError as e:
+            errors.append({"row": row, "error": _describe_error(e)})
+            continue
+        values["date"] = values["date"] or datetime.utcnow()
+        values["user_id"] = user.id
+        values["content_hash"] = idempotency.content_hash(values)
+        batch.append(values)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    if inserted:
+        versions.bump(db, model, user.id)
+    db.commit()
+    elapsed = time.perf_counter() - started
+    return {
+        "inserted": inserted,
+        "duplicates": duplicates,
+        "failed": len(errors),
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 6),
+        "rows_per_second": round(inserted / elapsed, 2) if elapsed else 0.0,
+    }
+
 
 # Expense CRUD functions
 def create_expense(
     expense: schemas.ExpenseBase, db: Session, user: schemas.UserRead
 ) -> schemas.ExpenseRead:
-    expense_obj = models.Expense(**expense.model_dump(), user_id=user.id)
+    fx.require_rate(db, expense.currency)
+    values = expense.model_dump() | {"date": datetime.utcnow()}
+    expense_obj = models.Expense(
+        **values, user_id=user.id, content_hash=idempotency.content_hash(values)
+    )
     db.add(expense_obj)
+    db.flush()
+    rollups.add(
+        db,
+        models.Expense,
+        user.id,
+        expense_obj.date,
+        expense_obj.category,
+        expense_obj.currency,
+        expense_obj.amount,
+    )
+    versions.bump(db, models.Expense, user.id)
     db.commit()
     db.refresh(expense_obj)
-    return jsonable_encoder(expense_obj)
+    return expense_obj
+
+
+def bulk_create_expenses(
+    records: Iterable[dict | RowParseError],
+    db: Session,
+    user: schemas.UserRead,
+    batch_size: int,
+    dedupe: bool = False,
+) -> schemas.BulkResult:
+    return _bulk_insert(
+        models.Expense, schemas.ExpenseImport, records, db, user, batch_size, dedupe
+    )
 
 
 def get_expenses(
     db: Session,
     user: schemas.UserRead,
     query: str = None,
-) -> list[schemas.ExpenseRead]:
-    if query:
-        return db.query(models.Expense).filter(
-            _or(
-                models.Expense.description.icontains(query),
-                models.Expense.category.cast(types.String).icontains(query),
-            ),
-            models.Expense.user_id == user.id,
-        )
-    return db.query(models.Expense).filter(models.Expense.user_id == user.id)
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: str = None,
+    category: list[schemas.ExpenseCategory] | None = None,
+    sort: schemas.ListSort = schemas.ListSort.DATE,
+    fields: tuple[str, ...] | None = None,
+    ranges: schemas.RangeFilter | None = None,
+    currency: str | None = None,
+) -> schemas.ExpensePage:
+    columns = _project_for_display(EXPENSE_COLUMNS, fields, currency)
+    expenses = db.query(*columns).filter(models.Expense.user_id == user.id)
+    criteria = _criteria(models.Expense, models.Expense.category, category, ranges)
+    expenses = expenses.filter(*criteria)
+    page = _search(expenses, models.Expense, db, query, sort, limit, cursor)
+    page["items"] = _in_currency(page["items"], currency, db)
+    return page
+
+
+def export_expenses(user: schemas.UserRead, fmt: schemas.ExportFormat) -> Iterator[str]:
+    return _export(models.Expense, EXPENSE_COLUMNS, user, fmt)
 
 
 def get_expense_by_id(
-    expense_id: int, db: Session, user: schemas.UserRead
+    expense_id: int, db: Session, user: schemas.UserRead, currency: str | None = None
 ) -> schemas.ExpenseRead:
     expense_obj = (
         db.query(models.Expense)
@@ -45,51 +423,130 @@ def get_expense_by_id(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Expense with id={expense_id} for user=@{user.username} not found",
         )
+    if currency is not None:
+        return _in_currency([expense_obj], currency, db)[0]
     return expense_obj
 
 
 def update_expense(
     expense_id: int, expense: schemas.ExpenseUpdate, db: Session, user: schemas.UserRead
 ) -> schemas.ExpenseRead:
+    fx.require_rate(db, expense.currency)
     expense_obj = get_expense_by_id(expense_id, db, user)
     if expense_obj:
+        previous = (
+            expense_obj.date,
+            expense_obj.category,
+            expense_obj.currency,
+            expense_obj.amount,
+        )
         for key, value in expense.model_dump(
             exclude_unset=True, exclude_defaults=True, exclude_none=True
         ).items():
-            if key in expense.model_dump().keys():
-                setattr(expense_obj, key, value)
+            setattr(expense_obj, key, value)
+        expense_obj.content_hash = idempotency.content_hash(
+            {
+                "date": expense_obj.date,
+                "amount": expense_obj.amount,
+                "currency": expense_obj.currency,
+                "description": expense_obj.description,
+            }
+        )
+        db.flush()
+        current = (
+            expense_obj.date,
+            expense_obj.category,
+            expense_obj.currency,
+            expense_obj.amount,
+        )
+        if current != previous:
+            rollups.remove(db, models.Expense, user.id, *previous)
+            rollups.add(db, models.Expense, user.id, *current)
+        versions.bump(db, models.Expense, user.id)
         db.commit()
         db.refresh(expense_obj)
-    return jsonable_encoder(expense_obj)
+    return expense_obj
+
+
+def batch_update_expenses(
+    batch: schemas.ExpenseBatchUpdate, db: Session, user: schemas.UserRead
+) -> schemas.BatchResult:
+    return _batch_update(models.Expense, "category", batch, db, user)
+
+
+def batch_delete_expenses(
+    batch_filter: schemas.ExpenseFilter, db: Session, user: schemas.UserRead
+) -> schemas.BatchResult:
+    return _batch_delete(models.Expense, "category", batch_filter, db, user)
 
 
 # Income CRUD functions
 def create_income_record(
     income: schemas.IncomeBase, db: Session, user: schemas.UserRead
 ) -> schemas.IncomeRead:
-    income_obj = models.Income(**income.model_dump(), user_id=user.id)
+    fx.require_rate(db, income.currency)
+    values = income.model_dump() | {"date": datetime.utcnow()}
+    income_obj = models.Income(
+        **values, user_id=user.id, content_hash=idempotency.content_hash(values)
+    )
     db.add(income_obj)
+    db.flush()
+    rollups.add(
+        db,
+        models.Income,
+        user.id,
+        income_obj.date,
+        income_obj.source,
+        income_obj.currency,
+        income_obj.amount,
+    )
+    versions.bump(db, models.Income, user.id)
     db.commit()
     db.refresh(income_obj)
-    return jsonable_encoder(income_obj)
+    return income_obj
+
+
+def bulk_create_income_records(
+    records: Iterable[dict | RowParseError],
+    db: Session,
+    user: schemas.UserRead,
+    batch_size: int,
+    dedupe: bool = False,
+) -> schemas.BulkResult:
+    return _bulk_insert(
+        models.Income, schemas.IncomeImport, records, db, user, batch_size, dedupe
+    )
 
 
 def get_income_records(
-    db: Session, user: schemas.UserRead, query: str = None
-) -> list[schemas.ExpenseRead]:
-    if query:
-        return db.query(models.Income).filter(
-            _or(
-                models.Income.description.icontains(query),
-                models.Income.source.cast(types.String).icontains(query),
-            ),
-            models.Income.user_id == user.id,
-        )
-    return db.query(models.Income).filter(models.Income.user_id == user.id)
+    db: Session,
+    user: schemas.UserRead,
+    query: str = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: str = None,
+    source: list[schemas.IncomeSource] | None = None,
+    sort: schemas.ListSort = schemas.ListSort.DATE,
+    fields: tuple[str, ...] | None = None,
+    ranges: schemas.RangeFilter | None = None,
+    currency: str | None = None,
+) -> schemas.IncomePage:
+    columns = _project_for_display(INCOME_COLUMNS, fields, currency)
+    incomes = db.query(*columns).filter(models.Income.user_id == user.id)
+    criteria = _criteria(models.Income, models.Income.source, source, ranges)
+    incomes = incomes.filter(*criteria)
+    page = _search(incomes, models.Income, db, query, sort, limit, cursor)
+    page["items"] = _in_currency(page["items"], currency, db)
+    return page
+
+
+def export_income_records(
+    user: schemas.UserRead, fmt: schemas.ExportFormat
+) -> Iterator[str]:
+    return _export(models.Income, INCOME_COLUMNS, user, fmt)
 
 
 def get_income_record_by_id(
-    income_id: int, db: Session, user: schemas.UserRead
+    income_id: int, db: Session, user: schemas.UserRead, currency: str | None = None
 ) -> schemas.ExpenseRead:
     income_obj = (
         db.query(models.Income)
@@ -101,27 +558,328 @@ def get_income_record_by_id(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Expense with id={income_id} for user=@{user.username} not found",
         )
+    if currency is not None:
+        return _in_currency([income_obj], currency, db)[0]
     return income_obj
 
 
 def update_income_record(
     income_id: int, income: schemas.IncomeUpdate, db: Session, user: schemas.UserRead
 ) -> schemas.IncomeRead:
+    fx.require_rate(db, income.currency)
     income_obj = get_income_record_by_id(income_id, db, user)
     if income_obj:
+        previous = (
+            income_obj.date,
+            income_obj.source,
+            income_obj.currency,
+            income_obj.amount,
+        )
         for key, value in income.model_dump(
             exclude_unset=True, exclude_defaults=True, exclude_none=True
         ).items():
-            if key in income.model_dump().keys():
-                setattr(income_obj, key, value)
+            setattr(income_obj, key, value)
+        income_obj.content_hash = idempotency.content_hash(
+            {
+                "date": income_obj.date,
+                "amount": income_obj.amount,
+                "currency": income_obj.currency,
+                "description": income_obj.description,
+            }
+        )
+        db.flush()
+        current = (
+            income_obj.date,
+            income_obj.source,
+            income_obj.currency,
+            income_obj.amount,
+        )
+        if current != previous:
+            rollups.remove(db, models.Income, user.id, *previous)
+            rollups.add(db, models.Income, user.id, *current)
+        versions.bump(db, models.Income, user.id)
         db.commit()
         db.refresh(income_obj)
-    return jsonable_encoder(income_obj)
+    return income_obj
+
+
+def batch_update_income_records(
+    batch: schemas.IncomeBatchUpdate, db: Session, user: schemas.UserRead
+) -> schemas.BatchResult:
+    return _batch_update(models.Income, "source", batch, db, user)
+
+
+def batch_delete_income_records(
+    batch_filter: schemas.IncomeFilter, db: Session, user: schemas.UserRead
+) -> schemas.BatchResult:
+    return _batch_delete(models.Income, "source", batch_filter, db, user)
+
+
+# Report functions
+def _stats(total: Decimal, count: int, low: Decimal, high: Decimal) -> dict:
+    return {
+        "total": total.quantize(fx.QUANTUM),
+        "count": count,
+        "min": low.quantize(fx.QUANTUM) if low is not None else None,
+        "max": high.quantize(fx.QUANTUM) if high is not None else None,
+        "avg": (total / count).quantize(fx.QUANTUM) if count else None,
+    }
+
+
+def _fold(
+    buckets: Iterable[tuple], key: str, currency: str, db: Session
+) -> tuple[dict, list[dict], dict[str, dict]]:
+    # buckets are (period, group, currency, total, count, min, max) rows.
+    # Each is converted at the rate of its period's first day, then folded
+    # into the overall, per-group and per-period stats; one pass in python
+    # over a few hundred rows instead of a query per breakdown
+    table = fx.rates(db)
+    overall = [Decimal(0), 0, None, None]
+    groups = defaultdict(lambda: [Decimal(0), 0, None, None])
+    periods = defaultdict(lambda: [Decimal(0), 0, None, None])
+    for period, group, source, total, count, low, high in buckets:
+        factor = table.factor(source, currency, date.fromisoformat(period))
+        total, low, high = total * factor, low * factor, high * factor
+        for tally in (overall, groups[group], periods[period]):
+            tally[0] += total
+            tally[1] += count
+            tally[2] = low if tally[2] is None else min(tally[2], low)
+            tally[3] = high if tally[3] is None else max(tally[3], high)
+    return (
+        _stats(*overall),
+        [{key: group, **_stats(*groups[group])} for group in sorted(groups)],
+        {period: _stats(*tally) for period, tally in periods.items()},
+    )
+
+
+def _aggregate(
+    model,
+    group_column,
+    db: Session,
+    user: schemas.UserRead,
+    period: schemas.ReportPeriod,
+    date_from: datetime | None,
+    date_to: datetime | None,
+    currency: str,
+    projected: Iterable[tuple] = (),
+) -> tuple[dict, list[dict], dict[str, dict]]:
+    filters = [model.user_id == user.id]
+    if date_from:
+        filters.append(model.date >= date_from)
+    if date_to:
+        filters.append(model.date < date_to)
+    bucket = rollups.period_bucket(model.date, period, db.get_bind().dialect.name)
+    buckets = db.execute(
+        select(
+            bucket,
+            group_column,
+            model.currency,
+            func.sum(model.amount),
+            func.count(model.id),
+            func.min(model.amount),
+            func.max(model.amount),
+        )
+        .where(*filters)
+        .group_by(bucket, group_column, model.currency)
+    )
+    return _fold(chain(buckets, projected), group_column.key, currency, db)
+
+
+def _aggregate_rollups(
+    rollup,
+    group_column,
+    db: Session,
+    user: schemas.UserRead,
+    date_from: datetime | None,
+    date_to: datetime | None,
+    currency: str,
+    projected: Iterable[tuple] = (),
+) -> tuple[dict, list[dict], dict[str, dict]]:
+    # same shape as _aggregate, read from the monthly rollups so the cost
+    # grows with the number of months rather than the number of records
+    filters = [rollup.user_id == user.id]
+    if date_from:
+        filters.append(rollup.month >= date_from.date())
+    if date_to:
+        filters.append(rollup.month < date_to.date())
+    buckets = db.execute(
+        select(
+            rollup.month,
+            group_column,
+            rollup.currency,
+            rollup.total,
+            rollup.count,
+            rollup.min,
+            rollup.max,
+        ).where(*filters)
+    )
+    return _fold(
+        chain(((row[0].isoformat(), *row[1:]) for row in buckets), projected),
+        group_column.key,
+        currency,
+        db,
+    )
+
+
+def _is_month_start(value: datetime | None) -> bool:
+    return value is None or value == datetime(value.year, value.month, 1)
+
+
+def get_summary(
+    db: Session,
+    user: schemas.UserRead,
+    period: schemas.ReportPeriod,
+    date_from: datetime = None,
+    date_to: datetime = None,
+    currency: str = schemas.BASE_CURRENCY,
+    include_projected: bool = False,
+) -> schemas.Summary:
+    # every amount is converted to currency, see _fold. Projected recurring
+    # occurrences are expanded in python and folded in with the stored ones
+    projected_expenses, projected_incomes = (), ()
+    if include_projected:
+        if date_to is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Projecting recurring records needs a date_to",
+            )
+        projected_expenses = recurring.projected_buckets(
+            db, models.Expense, user.id, period, date_from, date_to
+        )
+        projected_incomes = recurring.projected_buckets(
+            db, models.Income, user.id, period, date_from, date_to
+        )
+    if (
+        period == schemas.ReportPeriod.MONTH
+        and _is_month_start(date_from)
+        and _is_month_start(date_to)
+    ):
+        expenses, by_category, expense_periods = _aggregate_rollups(
+            models.ExpenseRollup,
+            models.ExpenseRollup.category,
+            db,
+            user,
+            date_from,
+            date_to,
+            currency,
+            projected_expenses,
+        )
+        incomes, by_source, income_periods = _aggregate_rollups(
+            models.IncomeRollup,
+            models.IncomeRollup.source,
+            db,
+            user,
+            date_from,
+            date_to,
+            currency,
+            projected_incomes,
+        )
+    else:
+        expenses, by_category, expense_periods = _aggregate(
+            models.Expense,
+            models.Expense.category,
+            db,
+            user,
+            period,
+            date_from,
+            date_to,
+            currency,
+            projected_expenses,
+        )
+        incomes, by_source, income_periods = _aggregate(
+            models.Income,
+            models.Income.source,
+            db,
+            user,
+            period,
+            date_from,
+            date_to,
+            currency,
+            projected_incomes,
+        )
+    empty = _stats(Decimal(0), 0, None, None)
+    by_period = []
+    for key in sorted(expense_periods.keys() | income_periods.keys()):
+        spent = expense_periods.get(key, empty)
+        earned = income_periods.get(key, empty)
+        by_period.append(
+            {
+                "period": key,
+                "expenses": spent,
+                "incomes": earned,
+                "net": earned["total"] - spent["total"],
+            }
+        )
+    return {
+        "currency": currency,
+        "expenses": expenses,
+        "incomes": incomes,
+        "net_cash_flow": incomes["total"] - expenses["total"],
+        "by_category": by_category,
+        "by_source": by_source,
+        "by_period": by_period,
+    }
 
 
 # User CRUD functions
-async def fetch_user_by_name(username: str, db: Session):
+def create_user(
+    user: schemas.UserCreate, hashed_password: str, db: Session
+) -> schemas.UserRead:
+    user_obj = models.User(**user.model_dump())
+    user_obj.password = hashed_password
+    db.add(user_obj)
+    db.commit()
+    db.refresh(user_obj)
+    user_cache.delete(user_obj.username)
+    return user_obj
+
+
+def get_users(
+    db: Session,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: str = None,
+    disabled: bool | None = None,
+    fields: tuple[str, ...] | None = None,
+) -> schemas.UserPage:
+    # password hashes are never selected
+    users = db.query(*_project(USER_COLUMNS, fields))
+    if disabled is not None:
+        users = users.filter(func.coalesce(models.User.disabled, False) == disabled)
+    return _paginate(users, [(models.User.id, int)], limit, cursor, descending=False)
+
+
+def fetch_user_by_name(username: str, db: Session):
     user = db.query(models.User).filter(models.User.username == username).first()
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found!")
     return user
+
+
+def set_users_disabled(
+    usernames: Iterable[str], disabled: bool, db: Session
+) -> schemas.BatchResult:
+    # one UPDATE ... WHERE username IN (...) per chunk, all in one transaction;
+    # users already in the target state are matched but left untouched
+    usernames = list(dict.fromkeys(usernames))
+    matched = affected = 0
+    for start in range(0, len(usernames), USER_BATCH_SIZE):
+        chunk = usernames[start : start + USER_BATCH_SIZE]
+        matched += db.scalar(
+            select(func.count()).where(models.User.username.in_(chunk))
+        )
+        affected += db.execute(
+            update(models.User)
+            .where(
+                models.User.username.in_(chunk),
+                func.coalesce(models.User.disabled, False) != disabled,
+            )
+            .values(disabled=disabled)
+        ).rowcount
+    db.commit()
+    user_cache.delete(*usernames)
+    return {"matched": matched, "affected": affected}
+
+
+def deactivate_user(username: str, db: Session) -> None:
+    if not set_users_disabled([username], True, db)["matched"]:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found!")
@@ -1,19 +1,202 @@
-from sqlalchemy import create_engine
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Union
+from sqlalchemy import create_engine, event, make_url
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from decouple import config
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import run_in_threadpool
+from decouple import Csv, config
+from src import metrics
+from src.cache import build_cache
 
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
 
-engine = create_engine(config("DATABASE_URI"))
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+class ThreadedSession(Session):
+    # mirrors AsyncSession.run_sync so request handlers can run the crud
+    # functions off the event loop whichever engine is configured
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self, *args, **kwargs)
+
+
+# pool tuning, only applied to queue-based pools
+POOL_SIZE = config("DB_POOL_SIZE", default=5, cast=int)
+MAX_OVERFLOW = config("DB_MAX_OVERFLOW", default=10, cast=int)
+POOL_TIMEOUT = config("DB_POOL_TIMEOUT", default=30, cast=float)
+# seconds before a connection is replaced, -1 keeps connections forever
+POOL_RECYCLE = config("DB_POOL_RECYCLE", default=1800, cast=int)
+POOL_PRE_PING = config("DB_POOL_PRE_PING", default=True, cast=bool)
+QUERY_CACHE_SIZE = config("DB_QUERY_CACHE_SIZE", default=500, cast=int)
+
+# sqlite connection pragmas
+SQLITE_JOURNAL_MODE = config("SQLITE_JOURNAL_MODE", default="WAL")
+SQLITE_SYNCHRONOUS = config("SQLITE_SYNCHRONOUS", default="NORMAL")
+SQLITE_MMAP_SIZE = config("SQLITE_MMAP_SIZE", default=256 * 1024 * 1024, cast=int)
+SQLITE_BUSY_TIMEOUT_MS = config("SQLITE_BUSY_TIMEOUT_MS", default=5000, cast=int)
+
+# server-side prepared statements for the postgres drivers that support them
+PG_PREPARE_THRESHOLD = config("PG_PREPARE_THRESHOLD", default=5, cast=int)
+PG_STATEMENT_CACHE_SIZE = config("PG_STATEMENT_CACHE_SIZE", default=500, cast=int)
+
+
+def _engine_options(uri: str) -> dict:
+    url = make_url(uri)
+    pool_class = url.get_dialect().get_pool_class(url)
+    options = {
+        "poolclass": metrics.timed_pool(pool_class),
+        "pool_pre_ping": POOL_PRE_PING,
+        "pool_recycle": POOL_RECYCLE,
+        "query_cache_size": QUERY_CACHE_SIZE,
+    }
+    if issubclass(pool_class, QueuePool):
+        options.update(
+            pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT
+        )
+    driver = url.get_driver_name()
+    if driver == "psycopg":
+        options["connect_args"] = {"prepare_threshold": PG_PREPARE_THRESHOLD}
+    elif driver == "asyncpg":
+        options["connect_args"] = {
+            "prepared_statement_cache_size": PG_STATEMENT_CACHE_SIZE
+        }
+    return options
+
+
+def _tune_sqlite(engine: Engine) -> None:
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
+
+
+def pool_status(engine: Engine) -> dict:
+    pool = engine.pool
+    status = {"pool": type(pool).__name__, "status": pool.status()}
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+            timeout=pool.timeout(),
+        )
+    return status
+
+
+DATABASE_URI = config("DATABASE_URI")
+
+engine = create_engine(DATABASE_URI, **_engine_options(DATABASE_URI))
+_tune_sqlite(engine)
+metrics.instrument_engine(engine, "primary")
+
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, bind=engine, class_=ThreadedSession
+)
+
+# optional async driver url for the same database, e.g. sqlite+aiosqlite://
+# or postgresql+asyncpg://, used for the request path when it is set
+ASYNC_DATABASE_URI = config("ASYNC_DATABASE_URI", default=None)
+
+async_engine = None
+AsyncSessionLocal = None
+
+if ASYNC_DATABASE_URI:
+    # requires sqlalchemy[asyncio] and the async driver named in the url
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URI, **_engine_options(ASYNC_DATABASE_URI)
+    )
+    _tune_sqlite(async_engine.sync_engine)
+    metrics.instrument_engine(async_engine.sync_engine, "async")
+    AsyncSessionLocal = async_sessionmaker(
+        bind=async_engine, autoflush=False, expire_on_commit=False
+    )
+
+# optional read replicas of the primary; reads rotate over them. With
+# ASYNC_DATABASE_URI set they must name an async driver as well
+REPLICA_DATABASE_URIS = config("REPLICA_DATABASE_URIS", default="", cast=Csv())
+# how long a user's reads stay on the primary after they wrote something,
+# should cover the replication lag
+READ_YOUR_WRITES_SECONDS = config("READ_YOUR_WRITES_SECONDS", default=5, cast=float)
+
+replica_engines = []
+for index, uri in enumerate(REPLICA_DATABASE_URIS):
+    if async_engine is not None:
+        replica = create_async_engine(uri, **_engine_options(uri))
+        sync_replica = replica.sync_engine
+    else:
+        replica = sync_replica = create_engine(uri, **_engine_options(uri))
+    _tune_sqlite(sync_replica)
+    metrics.instrument_engine(sync_replica, f"replica{index}")
+    replica_engines.append(replica)
+
+_replica_cycle = itertools.cycle(replica_engines)
+
+# usernames that wrote within the read-your-writes window
+recent_writes = build_cache(
+    "writes", maxsize=config("RECENT_WRITES_CACHE_SIZE", default=100_000, cast=int)
+)
+
+
+async def mark_write(*usernames: str) -> None:
+    if replica_engines:
+        for username in usernames:
+            await recent_writes.set_async(
+                username, {"at": time.time()}, READ_YOUR_WRITES_SECONDS
+            )
+
+
+async def use_replica(username: str | None) -> bool:
+    if not replica_engines or username is None:
+        return False
+    return await recent_writes.get_async(username) is None
+
+
+def read_engine(username: str | None):
+    # sync engine for work that runs outside a request session, i.e. exports;
+    # it runs in the threadpool, so the cache is read directly
+    if (
+        async_engine is None
+        and replica_engines
+        and username is not None
+        and recent_writes.get(username) is None
+    ):
+        return next(_replica_cycle)
+    return engine
+
+
+DBSession = Union[ThreadedSession, "AsyncSession"]
 
 Base = declarative_base()
 
 
-def get_db_session():
-    session = SessionLocal()
+@asynccontextmanager
+async def session_scope(replica: bool = False):
+    bind = next(_replica_cycle) if replica and replica_engines else None
+    if AsyncSessionLocal is not None:
+        options = {"bind": bind} if bind is not None else {}
+        async with AsyncSessionLocal(**options) as session:
+            yield session
+        return
+    session = SessionLocal(bind=bind) if bind is not None else SessionLocal()
     try:
         yield session
     finally:
-        session.close()
+        await run_in_threadpool(session.close)
+
+
+async def get_db_session():
+    async with session_scope() as session:
+        yield session
@@ -0,0 +1,55 @@
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import Iterable, Iterator
+from sqlalchemy import Row
+from src.schemas import ExportFormat
+
+MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+}
+
+# rows written into one chunk of the response body
+CHUNK_SIZE = 1000
+
+
+def _jsonable(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        # amounts leave as plain numbers, as they do in the API
+        return float(value)
+    return value
+
+
+def ndjson_chunks(columns: list[str], rows: Iterable[Row]) -> Iterator[str]:
+    buffer = []
+    for row in rows:
+        buffer.append(json.dumps(dict(zip(columns, map(_jsonable, row)))))
+        if len(buffer) >= CHUNK_SIZE:
+            yield "\n".join(buffer) + "\n"
+            buffer.clear()
+    if buffer:
+        yield "\n".join(buffer) + "\n"
+
+
+def csv_chunks(columns: list[str], rows: Iterable[Row]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(map(_jsonable, row))
+        if count % CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+ENCODERS = {
+    ExportFormat.NDJSON: ndjson_chunks,
+    ExportFormat.CSV: csv_chunks,
+}
@@ -0,0 +1,176 @@
+import argparse
+import bisect
+import csv
+import hashlib
+import threading
+import time
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import Iterable
+from decouple import config
+from fastapi import HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from src import models, statements
+from src.schemas import BASE_CURRENCY
+
+# how long a process keeps its copy of the rate table before reading it again
+FX_CACHE_SECONDS = config("FX_CACHE_SECONDS", default=300, cast=float)
+# optional date,currency,rate CSV loaded into fx_rates at start up
+FX_RATES_CSV = config("FX_RATES_CSV", default=None)
+# converted amounts are rounded to the storage scale
+QUANTUM = Decimal("0.0001")
+ONE = Decimal(1)
+
+
+class RateTable:
+    # per currency, the days rates were published on in ascending order and
+    # the rates themselves, so a lookup is a bisect for the latest rate on or
+    # before a day. Rates are the value of one unit in the base currency
+    def __init__(self, rows: Iterable[tuple[str, date, Decimal]]):
+        series: dict[str, tuple[list, list]] = defaultdict(lambda: ([], []))
+        digest = hashlib.sha256()
+        for currency, day, rate in rows:
+            days, rates = series[currency]
+            days.append(day)
+            rates.append(rate)
+            digest.update(f"{currency}{day}{rate}".encode())
+        self.series = dict(series)
+        # changes whenever the table does, for validators built on converted data
+        self.revision = digest.hexdigest()[:16]
+
+    def rate(self, currency: str, day: date) -> Decimal:
+        if currency == BASE_CURRENCY:
+            return ONE
+        series = self.series.get(currency)
+        if series is None:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                detail=f"No exchange rate is loaded for {currency}",
+            )
+        days, rates = series
+        # days before the first published rate use the earliest one
+        return rates[max(bisect.bisect_right(days, day) - 1, 0)]
+
+    def known(self, currency: str) -> bool:
+        return currency == BASE_CURRENCY or currency in self.series
+
+    def factor(self, source: str, target: str, day: date) -> Decimal:
+        if source == target:
+            return ONE
+        return self.rate(source, day) / self.rate(target, day)
+
+
+_table: RateTable | None = None
+_loaded_at = 0.0
+_lock = threading.Lock()
+
+
+def rates(db: Session) -> RateTable:
+    # the whole table is small and read at most once per FX_CACHE_SECONDS, so
+    # converting a page or a report costs no queries of its own
+    global _table, _loaded_at
+    if _table is None or time.monotonic() - _loaded_at > FX_CACHE_SECONDS:
+        with _lock:
+            if _table is None or time.monotonic() - _loaded_at > FX_CACHE_SECONDS:
+                rows = db.execute(
+                    select(
+                        models.FxRate.currency, models.FxRate.date, models.FxRate.rate
+                    ).order_by(models.FxRate.currency, models.FxRate.date)
+                ).all()
+                _table, _loaded_at = RateTable(rows), time.monotonic()
+    return _table
+
+
+def require_rate(db: Session, *currencies: str | None) -> None:
+    # records are only stored in currencies the reports can convert, so one
+    # record can't make every summary of its owner fail
+    table = rates(db)
+    for currency in currencies:
+        if currency is not None and not table.known(currency):
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                detail=f"No exchange rate is loaded for {currency}",
+            )
+
+
+def invalidate() -> None:
+    global _table
+    _table = None
+
+
+def convert(records: Iterable, target: str, table: RateTable) -> list[dict]:
+    # one factor per distinct (currency, day) on the page rather than per row;
+    # records are result rows or ORM objects carrying amount, currency, date
+    factors = {}
+    converted = []
+    for record in records:
+        if hasattr(record, "_asdict"):
+            values = record._asdict()
+        else:
+            values = {
+                column.key: getattr(record, column.key)
+                for column in record.__table__.columns
+            }
+        amount = values.get("amount")
+        if amount is not None:
+            currency, day = values["currency"], values["date"].date()
+            factor = factors.get((currency, day))
+            if factor is None:
+                factor = factors[currency, day] = table.factor(currency, target, day)
+            values["amount"] = (amount * factor).quantize(QUANTUM)
+        values["currency"] = target
+        converted.append(values)
+    return converted
+
+
+def _parse(rows: Iterable[dict]) -> list[dict]:
+    parsed = []
+    for line, row in enumerate(rows, start=2):
+        try:
+            currency = row["currency"].strip().upper()
+            if len(currency) != 3 or not currency.isalpha():
+                raise ValueError(f"bad currency code {currency!r}")
+            rate = Decimal(row["rate"])
+            if rate <= 0:
+                raise ValueError("rates must be positive")
+            parsed.append(
+                {
+                    "currency": currency,
+                    "date": date.fromisoformat(row["date"].strip()),
+                    "rate": rate,
+                }
+            )
+        except (KeyError, ValueError, AttributeError, InvalidOperation) as e:
+            raise ValueError(f"line {line}: {e}") from e
+    return parsed
+
+
+def load(db: Session, path: str, batch_size: int = 1000) -> int:
+    # upserts date,currency,rate rows; rerunning a file only rewrites rates
+    with open(path, newline="", encoding="utf-8") as handle:
+        rows = _parse(csv.DictReader(handle))
+    for start in range(0, len(rows), batch_size):
+        statements.upsert(
+            db,
+            models.FxRate,
+            rows[start : start + batch_size],
+            ["currency", "date"],
+            lambda new: {"rate": new.rate},
+        )
+    db.commit()
+    invalidate()
+    return len(rows)
+
+
+if __name__ == "__main__":
+    from src.dbconfig import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Maintain the FX rate table")
+    parser.add_argument("command", choices=["load"])
+    parser.add_argument("path", help="CSV file with date,currency,rate columns")
+    args = parser.parse_args()
+
+    with SessionLocal() as session:
+        print(f"loaded {load(session, args.path)} rates")
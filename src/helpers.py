@@ -1,11 +1,17 @@
-from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from decouple import Csv, config
 from fastapi import Depends, HTTPException, status
-from fastapi.encoders import jsonable_encoder
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from sqlalchemy.orm import Session
-from src.dbconfig import get_db_session
+from src import dbconfig, metrics
+from src.cache import USER_CACHE_TTL, MemoryCache, user_cache
+from src.dbconfig import DBSession, get_db_session
 from src.models import User
 from src.schemas import TokenData, UserRead, Token
 
@@ -20,6 +26,13 @@ credentials_exception = HTTPException(
 class PasswordHandler:
     pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+    # bcrypt is deliberately slow, so it runs on a small dedicated pool and
+    # callers are turned away once MAX_PENDING hashes are queued or running
+    WORKERS = config("PASSWORD_HASH_WORKERS", default=4, cast=int)
+    MAX_PENDING = WORKERS + config("PASSWORD_HASH_QUEUE_DEPTH", default=32, cast=int)
+    executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="bcrypt")
+    pending = 0
+
     @classmethod
     def get_password_hash(cls, password: str) -> str:
         return cls.pwd_context.hash(secret=password)
@@ -28,39 +41,102 @@ class PasswordHandler:
     def verify_password(cls, password: str, hashed_password: str):
         return cls.pwd_context.verify(secret=password, hash=hashed_password)
 
+    @staticmethod
+    def _timed(submitted: float, fn, *args) -> tuple:
+        started = time.perf_counter()
+        return fn(*args), started - submitted, time.perf_counter() - started
+
+    @classmethod
+    async def _offload(cls, fn, *args):
+        if cls.pending >= cls.MAX_PENDING:
+            metrics.password_rejected.inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent password operations, retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        cls.pending += 1
+        try:
+            result, wait, elapsed = await asyncio.get_running_loop().run_in_executor(
+                cls.executor, cls._timed, time.perf_counter(), fn, *args
+            )
+        finally:
+            cls.pending -= 1
+        metrics.password_queue_wait.observe(wait)
+        metrics.password_duration.observe(elapsed)
+        return result
+
+    @classmethod
+    async def get_password_hash_async(cls, password: str) -> str:
+        return await cls._offload(cls.get_password_hash, password)
+
+    @classmethod
+    async def verify_password_async(cls, password: str, hashed_password: str):
+        return await cls._offload(cls.verify_password, password, hashed_password)
+
+
+metrics.password_pending.set_function(lambda: PasswordHandler.pending)
+
 
 class TokenHandler:
-    DEFAULT_TOKEN_EXPIRY = timedelta(minutes=30)
+    DEFAULT_TOKEN_EXPIRY = timedelta(
+        minutes=config("ACCESS_TOKEN_EXPIRE_MINUTES", default=30, cast=int)
+    )
     ALGORITHM = "HS256"
-    SECRET_KEY = "1b449917b1924e105efb705ab22c53fb8329aed6c4b2c02d85a780a123b17e59"
-
-    @staticmethod
-    def create_access_token(data: dict, expiry: timedelta | None = None) -> str:
-        data_to_encode = data.copy()
-        expires_at = datetime.utcnow() + (
-            timedelta(minutes=expiry) if expiry else TokenHandler.DEFAULT_TOKEN_EXPIRY
+    # "kid:secret" pairs; the first signs new tokens, the others only verify,
+    # so a rotated-out key keeps its tokens valid until they expire
+    SIGNING_KEYS = dict(
+        pair.split(":", 1)
+        for pair in config(
+            "JWT_SIGNING_KEYS",
+            default="k1:1b449917b1924e105efb705ab22c53fb8329aed6c4b2c02d85a780a123b17e59",
+            cast=Csv(),
         )
+    )
+    ACTIVE_KEY_ID = next(iter(SIGNING_KEYS))
+    # verified claims by token digest, each entry lives until its token's
+    # exp, so a hit skips the signature check. Kept per process on purpose
+    verified_tokens = MemoryCache(
+        maxsize=config("TOKEN_CACHE_SIZE", default=50_000, cast=int)
+    )
 
-        data_to_encode.update({"expires_at": jsonable_encoder(expires_at)})
-        access_token = jwt.encode(
-            claims=data_to_encode,
-            key=TokenHandler.SECRET_KEY,
-            algorithm=TokenHandler.ALGORITHM,
+    @classmethod
+    def create_access_token(cls, data: dict, expiry: timedelta | None = None) -> str:
+        issued_at = datetime.now(timezone.utc)
+        claims = {
+            **data,
+            "iat": issued_at,
+            "exp": issued_at + (expiry or cls.DEFAULT_TOKEN_EXPIRY),
+        }
+        return jwt.encode(
+            claims=claims,
+            key=cls.SIGNING_KEYS[cls.ACTIVE_KEY_ID],
+            algorithm=cls.ALGORITHM,
+            headers={"kid": cls.ACTIVE_KEY_ID},
         )
-        return access_token
 
-    @staticmethod
-    def decode_token(token: str) -> TokenData | None:
-        token_data = None
+    @classmethod
+    def decode_token(cls, token: str) -> TokenData:
+        digest = hashlib.sha256(token.encode()).hexdigest()
+        cached = cls.verified_tokens.get(digest)
+        if cached is not None:
+            return TokenData(**cached)
         try:
+            key = cls.SIGNING_KEYS.get(jwt.get_unverified_header(token).get("kid"))
+            if key is None:
+                raise credentials_exception
             payload: dict = jwt.decode(
                 token=token,
-                key=TokenHandler.SECRET_KEY,
-                algorithms=[TokenHandler.ALGORITHM],
+                key=key,
+                algorithms=[cls.ALGORITHM],
+                options={"require_exp": True, "require_iat": True, "require_sub": True},
             )
-            token_data = TokenData(username=payload.get("sub"))
         except JWTError:
             raise credentials_exception
+        token_data = TokenData(username=payload["sub"])
+        ttl = payload["exp"] - time.time()
+        if ttl > 0:
+            cls.verified_tokens.set(digest, token_data.model_dump(), ttl)
         return token_data
 
 
@@ -74,25 +150,38 @@ def get_user_in_db(username: str, db: Session) -> User:
     return user
 
 
+def get_detached_user(username: str, db: Session) -> User:
+    # ends the read transaction so the pooled connection is not held
+    # while the password check waits on the bcrypt workers
+    user = get_user_in_db(username, db)
+    db.expunge(user)
+    db.rollback()
+    return user
+
+
 async def authenticate_user(
-    username: str, password: str, db: Session
+    username: str, password: str, db: DBSession
 ) -> UserRead | bool:
-    user = get_user_in_db(username, db)
+    user = await db.run_sync(lambda session: get_detached_user(username, session))
     if not user:
         return False
-    if not PasswordHandler.verify_password(password, user.password):
+    if not await PasswordHandler.verify_password_async(password, user.password):
         return False
     return user
 
 
-async def get_current_user(
-    token: Token = Depends(oauth2_scheme),
-    db: Session = Depends(get_db_session),
-) -> UserRead:
+async def get_current_user(token: Token = Depends(oauth2_scheme)) -> UserRead:
     token_data = TokenHandler.decode_token(token)
     if not token_data:
         raise credentials_exception
-    user = get_user_in_db(token_data.username, db)
+    cached = await user_cache.get_async(token_data.username)
+    if cached is not None:
+        return UserRead(**cached)
+    replica = await dbconfig.use_replica(token_data.username)
+    async with dbconfig.session_scope(replica=replica) as db:
+        user = await db.run_sync(
+            lambda session: get_user_in_db(token_data.username, session)
+        )
     if not user:
         raise credentials_exception
     user = UserRead(
@@ -101,6 +190,7 @@ async def get_current_user(
         disabled=user.disabled,
         id=user.id,
     )
+    await user_cache.set_async(user.username, user.model_dump(), USER_CACHE_TTL)
     return user
 
 
@@ -114,3 +204,31 @@ async def get_current_active_user(
         )
     return current_user
 
+
+async def get_current_admin_user(
+    current_user: UserRead = Depends(get_current_active_user),
+) -> UserRead:
+    if current_user.username != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Not allowed!"
+        )
+    return current_user
+
+
+async def get_read_session(
+    current_user: UserRead = Depends(get_current_active_user),
+):
+    # replicas serve reads unless the user wrote within the last few seconds
+    replica = await dbconfig.use_replica(current_user.username)
+    async with dbconfig.session_scope(replica=replica) as session:
+        yield session
+
+
+async def get_write_session(
+    current_user: UserRead = Depends(get_current_active_user),
+    db: DBSession = Depends(get_db_session),
+) -> DBSession:
+    # marked up front so the window is open before the response can reach
+    # the client and it sends its next read
+    await dbconfig.mark_write(current_user.username)
+    return db
@@ -0,0 +1,161 @@
+import argparse
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Callable
+from decouple import config
+from fastapi import HTTPException, Request, Response, status
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from src import models
+from src.schemas import BASE_CURRENCY, UserRead
+
+# how long a stored response is replayed for a repeated key
+IDEMPOTENCY_KEY_TTL = timedelta(
+    hours=config("IDEMPOTENCY_KEY_TTL_HOURS", default=24, cast=float)
+)
+
+
+def content_hash(values: dict) -> str:
+    # identifies a record by what it says, so re-imported rows can be spotted
+    payload = f"{values['date'].isoformat()}|{float(values['amount'])!r}|{values['description']}"
+    # base currency records keep the hashes they had before currencies existed
+    currency = values.get("currency") or BASE_CURRENCY
+    if currency != BASE_CURRENCY:
+        payload += f"|{currency}"
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def fingerprint(*parts) -> str:
+    # the request a key was first used for; reusing the key for a different
+    # request is a client bug and is refused rather than replayed
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+async def body_digest(request: Request) -> str:
+    # bulk bodies are streamed into the import rather than parsed up front,
+    # so their fingerprint covers the raw bytes. The body is cached on the
+    # request and read again from there
+    return hashlib.sha256(await request.body()).hexdigest()
+
+
+def _find(db: Session, user_id: int, key: str) -> models.IdempotencyKey | None:
+    return db.scalar(
+        select(models.IdempotencyKey).where(
+            models.IdempotencyKey.user_id == user_id,
+            models.IdempotencyKey.key == key,
+        )
+    )
+
+
+def _replay(record: models.IdempotencyKey, request_fingerprint: str) -> Response:
+    if record.fingerprint != request_fingerprint:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+            detail="Idempotency-Key was already used for a different request",
+        )
+    if record.response is None:
+        # the first request holds the key until its response is stored
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A request with this Idempotency-Key is still being processed",
+            headers={"Retry-After": "1"},
+        )
+    return Response(
+        record.response,
+        status_code=record.status_code,
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def run(
+    db: Session,
+    user: UserRead,
+    key: str | None,
+    request_fingerprint: str,
+    write: Callable[[], Response],
+) -> Response:
+    # runs write once per (user, key). The key row is flushed first so it
+    # commits together with the write, and a concurrent duplicate fails on
+    # the unique constraint instead of writing twice.
+    if key is None:
+        return write()
+    record = _find(db, user.id, key)
+    if record is not None:
+        if record.created_at > datetime.utcnow() - IDEMPOTENCY_KEY_TTL:
+            return _replay(record, request_fingerprint)
+        db.delete(record)
+        db.flush()
+    record = models.IdempotencyKey(
+        user_id=user.id, key=key, fingerprint=request_fingerprint
+    )
+    db.add(record)
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        return _replay(_find(db, user.id, key), request_fingerprint)
+    response = write()
+    db.execute(
+        update(models.IdempotencyKey)
+        .where(models.IdempotencyKey.id == record.id)
+        .values(status_code=response.status_code, response=response.body.decode())
+    )
+    db.commit()
+    return response
+
+
+def purge(db: Session) -> int:
+    cutoff = datetime.utcnow() - IDEMPOTENCY_KEY_TTL
+    deleted = db.execute(
+        delete(models.IdempotencyKey).where(models.IdempotencyKey.created_at < cutoff)
+    ).rowcount
+    db.commit()
+    return deleted
+
+
+def backfill(db: Session, batch_size: int = 1000) -> int:
+    # content hashes for records stored before the column existed
+    written = 0
+    for model in (models.Expense, models.Income):
+        while True:
+            rows = db.execute(
+                select(
+                    model.id,
+                    model.date,
+                    model.amount,
+                    model.currency,
+                    model.description,
+                )
+                .where(model.content_hash.is_(None))
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            db.execute(
+                update(model),
+                [
+                    {"id": row.id, "content_hash": content_hash(row._asdict())}
+                    for row in rows
+                ],
+            )
+            db.commit()
+            written += len(rows)
+    return written
+
+
+if __name__ == "__main__":
+    from src.dbconfig import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Maintain idempotency data")
+    parser.add_argument("command", choices=["purge", "backfill"])
+    args = parser.parse_args()
+
+    with SessionLocal() as session:
+        if args.command == "purge":
+            print(f"removed {purge(session)} expired idempotency keys")
+        else:
+            print(f"hashed {backfill(session)} records")
@@ -0,0 +1,65 @@
+import csv
+import io
+import json
+from typing import Iterator
+from fastapi import HTTPException, Request, status
+from starlette.datastructures import UploadFile
+
+
+DEFAULT_BATCH_SIZE = 500
+MAX_BATCH_SIZE = 5000
+
+
+class RowParseError(ValueError):
+    pass
+
+
+def _ndjson_records(lines) -> Iterator[dict | RowParseError]:
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            yield RowParseError(f"Invalid JSON: {e.msg}")
+
+
+def _csv_records(lines) -> Iterator[dict]:
+    for record in csv.DictReader(lines):
+        # empty cells fall back to the schema defaults
+        yield {key: value for key, value in record.items() if value not in ("", None)}
+
+
+def _upload_records(upload: UploadFile) -> Iterator[dict | RowParseError]:
+    # the upload is spooled to disk by starlette, read it lazily line by line
+    lines = io.TextIOWrapper(upload.file, encoding="utf-8", newline="")
+    filename = (upload.filename or "").lower()
+    if filename.endswith(".csv") or upload.content_type == "text/csv":
+        return _csv_records(lines)
+    return _ndjson_records(lines)
+
+
+async def read_records(request: Request) -> Iterator[dict | RowParseError]:
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if not isinstance(upload, UploadFile):
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                detail="Expected a CSV or NDJSON file in the 'file' field",
+            )
+        return _upload_records(upload)
+    if content_type.startswith("application/x-ndjson"):
+        body = (await request.body()).decode("utf-8")
+        return _ndjson_records(body.splitlines())
+    try:
+        records = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        records = None
+    if not isinstance(records, list):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+            detail="Expected a JSON array of records",
+        )
+    return iter(records)
@@ -0,0 +1,484 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import tempfile
+import threading
+from contextlib import closing, contextmanager
+from datetime import datetime, timedelta
+from typing import Iterable
+from decouple import config
+from fastapi import HTTPException, status
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from src import crud, models, rollups
+from src.dbconfig import SessionLocal
+from src.export import CHUNK_SIZE
+from src.ingest import RowParseError
+from src.schemas import ExportFormat, JobKind, JobStatus, UserRead
+
+# workers per process, 0 leaves this process submit-only
+JOB_WORKERS = config("JOB_WORKERS", default=2, cast=int)
+# jobs one user may have running at once, and queued or running in total
+JOB_MAX_RUNNING_PER_USER = config("JOB_MAX_RUNNING_PER_USER", default=1, cast=int)
+JOB_MAX_PENDING_PER_USER = config("JOB_MAX_PENDING_PER_USER", default=10, cast=int)
+JOB_POLL_SECONDS = config("JOB_POLL_SECONDS", default=1.0, cast=float)
+# a running job whose heartbeat is older than this is assumed orphaned by a
+# dead process and queued again, resuming from its checkpoint
+JOB_STALE_SECONDS = config("JOB_STALE_SECONDS", default=120, cast=float)
+# how often a running job's heartbeat is refreshed besides its progress calls
+JOB_HEARTBEAT_SECONDS = config(
+    "JOB_HEARTBEAT_SECONDS", default=JOB_STALE_SECONDS / 4, cast=float
+)
+JOB_SHUTDOWN_SECONDS = config("JOB_SHUTDOWN_SECONDS", default=10, cast=float)
+JOB_RESULTS_DIR = config(
+    "JOB_RESULTS_DIR", default=os.path.join(tempfile.gettempdir(), "finapp-jobs")
+)
+# imports keep their records on the job row until they finish
+JOB_MAX_IMPORT_RECORDS = config("JOB_MAX_IMPORT_RECORDS", default=100_000, cast=int)
+JOB_MAX_PARAMS_BYTES = config(
+    "JOB_MAX_PARAMS_BYTES", default=32 * 1024 * 1024, cast=int
+)
+# row errors kept in an import job's result
+MAX_REPORTED_ERRORS = 100
+
+IMPORTS = {
+    JobKind.EXPENSE_IMPORT: crud.bulk_create_expenses,
+    JobKind.INCOME_IMPORT: crud.bulk_create_income_records,
+}
+EXPORTS = {
+    JobKind.EXPENSE_EXPORT: (models.Expense, crud.export_expenses),
+    JobKind.INCOME_EXPORT: (models.Income, crud.export_income_records),
+}
+FINISHED = (JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobInterrupted(Exception):
+    # the process is shutting down; the job goes back to the queue
+    pass
+
+
+_stopping = threading.Event()
+_wakeup: asyncio.Event | None = None
+_workers: list[asyncio.Task] = []
+_claim_lock = threading.Lock()
+
+
+class JobContext:
+    def __init__(self, job: models.Job, user: UserRead):
+        self.job_id = job.id
+        self.user = user
+        self.params = json.loads(job.params)
+        self.checkpoint = job.checkpoint
+        self.result = json.loads(job.result) if job.result else None
+
+    def progress(self, processed: int, total: int | None = None) -> None:
+        # records progress and a heartbeat, and is where a job notices that
+        # it was cancelled or that the process is stopping
+        values = {"processed": processed, "heartbeat_at": datetime.utcnow()}
+        if total is not None:
+            values["total"] = total
+        if self.result is not None:
+            values["result"] = json.dumps(self.result)
+        with SessionLocal() as db:
+            db.execute(
+                update(models.Job).where(models.Job.id == self.job_id).values(**values)
+            )
+            cancelled = db.scalar(
+                select(models.Job.cancel_requested).where(models.Job.id == self.job_id)
+            )
+            db.commit()
+        if cancelled:
+            raise JobCancelled()
+        if _stopping.is_set():
+            raise JobInterrupted()
+
+
+def encode_record(record: dict | RowParseError) -> dict:
+    # parse errors are kept in place so row numbers still line up
+    if isinstance(record, RowParseError):
+        return {"__parse_error__": str(record)}
+    return record
+
+
+def encode_records(records: Iterable[dict | RowParseError]) -> list[dict]:
+    encoded = [
+        encode_record(record)
+        for record in itertools.islice(records, JOB_MAX_IMPORT_RECORDS + 1)
+    ]
+    if len(encoded) > JOB_MAX_IMPORT_RECORDS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"An import job takes at most {JOB_MAX_IMPORT_RECORDS} records",
+        )
+    return encoded
+
+
+def _decode_record(record: dict) -> dict | RowParseError:
+    if isinstance(record, dict) and "__parse_error__" in record:
+        return RowParseError(record["__parse_error__"])
+    return record
+
+
+def result_path(job_id: int, fmt: ExportFormat) -> str:
+    return os.path.join(JOB_RESULTS_DIR, f"job-{job_id}.{fmt}")
+
+
+def _run_import(context: JobContext, db: Session, kind: JobKind) -> dict:
+    records = [_decode_record(record) for record in context.params["records"]]
+    batch_size = context.params["batch_size"]
+    summary = context.result or {
+        "inserted": 0,
+        "duplicates": 0,
+        "failed": 0,
+        "errors": [],
+    }
+    context.result = summary
+    offset = context.checkpoint
+    context.progress(offset, total=len(records))
+    while offset < len(records):
+        chunk = records[offset : offset + batch_size]
+        end = offset + len(chunk)
+        # staged on the import's session so the checkpoint commits together
+        # with the chunk's rows and a resumed job never inserts them twice
+        db.execute(
+            update(models.Job)
+            .where(models.Job.id == context.job_id)
+            .values(checkpoint=end)
+        )
+        result = IMPORTS[kind](
+            iter(chunk), db, context.user, batch_size, context.params["dedupe"]
+        )
+        summary["inserted"] += result["inserted"]
+        summary["duplicates"] += result["duplicates"]
+        summary["failed"] += result["failed"]
+        for error in result["errors"]:
+            if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+                summary["errors"].append({**error, "row": error["row"] + offset})
+        offset = end
+        context.progress(offset)
+    return summary
+
+
+def _run_export(context: JobContext, db: Session, kind: JobKind) -> dict:
+    model, export = EXPORTS[kind]
+    fmt = ExportFormat(context.params["format"])
+    total = db.scalar(
+        select(func.count()).select_from(model).where(model.user_id == context.user.id)
+    )
+    db.rollback()
+    context.progress(0, total=total)
+    os.makedirs(JOB_RESULTS_DIR, exist_ok=True)
+    path = result_path(context.job_id, fmt)
+    written = 0
+    # exports are cheap to redo, so a resumed export starts over
+    with open(path + ".part", "w", newline="") as handle:
+        with closing(export(context.user, fmt)) as chunks:
+            for chunk in chunks:
+                handle.write(chunk)
+                written = min(total, written + CHUNK_SIZE)
+                context.progress(written)
+    os.replace(path + ".part", path)
+    return {"format": fmt, "rows": total}
+
+
+def _run_rebuild(context: JobContext, db: Session, kind: JobKind) -> dict:
+    context.progress(0)
+    return {"buckets": rollups.rebuild(db, context.user.id)}
+
+
+HANDLERS = {
+    **{kind: _run_import for kind in IMPORTS},
+    **{kind: _run_export for kind in EXPORTS},
+    JobKind.ROLLUP_REBUILD: _run_rebuild,
+}
+
+
+def _finish(job_id: int, **values) -> None:
+    with SessionLocal() as db:
+        db.execute(update(models.Job).where(models.Job.id == job_id).values(**values))
+        db.commit()
+
+
+@contextmanager
+def _heartbeat(job_id: int):
+    # progress calls can be far apart, e.g. during a rollup rebuild, and a
+    # stale heartbeat would have another worker run the job a second time
+    done = threading.Event()
+
+    def beat() -> None:
+        while not done.wait(JOB_HEARTBEAT_SECONDS):
+            try:
+                with SessionLocal() as db:
+                    db.execute(
+                        update(models.Job)
+                        .where(
+                            models.Job.id == job_id,
+                            models.Job.status == JobStatus.RUNNING,
+                        )
+                        .values(heartbeat_at=datetime.utcnow())
+                    )
+                    db.commit()
+            except Exception:
+                logger.exception("job %s heartbeat failed", job_id)
+
+    thread = threading.Thread(target=beat, name=f"job-{job_id}-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        done.set()
+        thread.join()
+
+
+def _execute(job_id: int) -> None:
+    with SessionLocal() as db:
+        job = db.get(models.Job, job_id)
+        owner = db.get(models.User, job.user_id)
+        user = UserRead(
+            username=owner.username,
+            fullname=owner.fullname,
+            disabled=owner.disabled,
+            id=owner.id,
+        )
+        context = JobContext(job, user)
+        kind = job.kind
+        db.rollback()
+        try:
+            with _heartbeat(job_id):
+                result = HANDLERS[kind](context, db, kind)
+        except JobInterrupted:
+            db.rollback()
+            _finish(job_id, status=JobStatus.QUEUED)
+            return
+        except JobCancelled:
+            db.rollback()
+            _finish(
+                job_id,
+                status=JobStatus.CANCELLED,
+                result=json.dumps(context.result) if context.result else None,
+                finished_at=datetime.utcnow(),
+            )
+            return
+        except Exception as e:
+            db.rollback()
+            logger.exception("job %s failed", job_id)
+            _finish(
+                job_id,
+                status=JobStatus.FAILED,
+                error=str(e),
+                result=json.dumps(context.result) if context.result else None,
+                finished_at=datetime.utcnow(),
+            )
+            return
+    _finish(
+        job_id,
+        status=JobStatus.SUCCEEDED,
+        result=json.dumps(result),
+        finished_at=datetime.utcnow(),
+    )
+
+
+def _claim() -> int | None:
+    # the lock keeps this process's workers from racing each other past the
+    # per-user limit; the conditional UPDATE settles races between processes
+    now = datetime.utcnow()
+    with _claim_lock, SessionLocal() as db:
+        db.execute(
+            update(models.Job)
+            .where(
+                models.Job.status == JobStatus.RUNNING,
+                models.Job.heartbeat_at < now - timedelta(seconds=JOB_STALE_SECONDS),
+            )
+            .values(status=JobStatus.QUEUED)
+        )
+        busy = (
+            select(models.Job.user_id)
+            .where(models.Job.status == JobStatus.RUNNING)
+            .group_by(models.Job.user_id)
+            .having(func.count() >= JOB_MAX_RUNNING_PER_USER)
+        )
+        candidates = db.scalars(
+            select(models.Job.id)
+            .where(
+                models.Job.status == JobStatus.QUEUED,
+                models.Job.user_id.not_in(busy),
+            )
+            .order_by(models.Job.id)
+            .limit(JOB_WORKERS)
+        ).all()
+        for job_id in candidates:
+            claimed = db.execute(
+                update(models.Job)
+                .where(models.Job.id == job_id, models.Job.status == JobStatus.QUEUED)
+                .values(
+                    status=JobStatus.RUNNING,
+                    started_at=func.coalesce(models.Job.started_at, now),
+                    heartbeat_at=now,
+                    attempts=models.Job.attempts + 1,
+                )
+            ).rowcount
+            if claimed:
+                db.commit()
+                return job_id
+        db.commit()
+    return None
+
+
+async def _worker() -> None:
+    while not _stopping.is_set():
+        try:
+            job_id = await run_in_threadpool(_claim)
+        except Exception:
+            logger.exception("claiming a job failed")
+            job_id = None
+        if job_id is None:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            _wakeup.clear()
+            continue
+        await run_in_threadpool(_execute, job_id)
+
+
+async def start() -> None:
+    global _wakeup
+    _stopping.clear()
+    _wakeup = asyncio.Event()
+    _workers.extend(asyncio.create_task(_worker()) for _ in range(JOB_WORKERS))
+
+
+async def stop() -> None:
+    # running jobs stop at their next progress call and are queued again
+    _stopping.set()
+    notify()
+    if _workers:
+        _, pending = await asyncio.wait(_workers, timeout=JOB_SHUTDOWN_SECONDS)
+        for task in pending:
+            task.cancel()
+    _workers.clear()
+
+
+def notify() -> None:
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+def describe(job: models.Job) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "processed": job.processed,
+        "total": job.total,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "cancel_requested": job.cancel_requested,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def submit(db: Session, user: UserRead, kind: JobKind, params: dict) -> dict:
+    pending = db.scalar(
+        select(func.count()).where(
+            models.Job.user_id == user.id, models.Job.status.not_in(FINISHED)
+        )
+    )
+    if pending >= JOB_MAX_PENDING_PER_USER:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"At most {JOB_MAX_PENDING_PER_USER} jobs may be pending per user",
+            headers={"Retry-After": str(int(JOB_POLL_SECONDS) + 1)},
+        )
+    encoded = json.dumps(params)
+    if len(encoded.encode()) > JOB_MAX_PARAMS_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Job payloads are limited to {JOB_MAX_PARAMS_BYTES} bytes",
+        )
+    job = models.Job(
+        user_id=user.id,
+        kind=kind,
+        status=JobStatus.QUEUED,
+        params=encoded,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return describe(job)
+
+
+def _get(db: Session, user: UserRead, job_id: int) -> models.Job:
+    job = db.scalar(
+        select(models.Job).where(models.Job.id == job_id, models.Job.user_id == user.id)
+    )
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Job with id={job_id} for user=@{user.username} not found",
+        )
+    return job
+
+
+def get(db: Session, user: UserRead, job_id: int) -> dict:
+    return describe(_get(db, user, job_id))
+
+
+def list_jobs(db: Session, user: UserRead, limit: int) -> list[dict]:
+    jobs = db.scalars(
+        select(models.Job)
+        .where(models.Job.user_id == user.id)
+        .order_by(models.Job.id.desc())
+        .limit(limit)
+    )
+    return [describe(job) for job in jobs]
+
+
+def cancel(db: Session, user: UserRead, job_id: int) -> dict:
+    job = _get(db, user, job_id)
+    # a queued job is cancelled outright, a running one at its next step
+    db.execute(
+        update(models.Job)
+        .where(models.Job.id == job.id, models.Job.status == JobStatus.QUEUED)
+        .values(
+            status=JobStatus.CANCELLED,
+            cancel_requested=True,
+            finished_at=datetime.utcnow(),
+        )
+    )
+    db.execute(
+        update(models.Job)
+        .where(models.Job.id == job.id, models.Job.status == JobStatus.RUNNING)
+        .values(cancel_requested=True)
+    )
+    db.commit()
+    db.refresh(job)
+    return describe(job)
+
+
+def download(db: Session, user: UserRead, job_id: int) -> tuple[str, ExportFormat]:
+    job = _get(db, user, job_id)
+    if job.kind not in EXPORTS or job.status != JobStatus.SUCCEEDED:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Only finished export jobs have a file to download",
+        )
+    fmt = ExportFormat(json.loads(job.result)["format"])
+    path = result_path(job.id, fmt)
+    if not os.path.exists(path):
+        # results live on the local disk of the process that ran the job
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE, detail="The export file is gone"
+        )
+    return path, fmt
@@ -0,0 +1,215 @@
+import threading
+import time
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+REGISTRY: list["_Metric"] = []
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    @staticmethod
+    def _labels(labels: dict) -> str:
+        if not labels:
+            return ""
+        pairs = ",".join(
+            f'{key}="{str(value).replace(chr(34), chr(39))}"'
+            for key, value in sorted(labels.items())
+        )
+        return "{" + pairs + "}"
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        return "\n".join(header + self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            return [
+                f"{self.name}{self._labels(dict(key))} {value}"
+                for key, value in self._values.items()
+            ]
+
+
+class Gauge(_Metric):
+    # each series is sampled from a callback at scrape time
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._functions: dict[tuple, object] = {}
+
+    def set_function(self, function, **labels) -> None:
+        with self._lock:
+            self._functions[tuple(sorted(labels.items()))] = function
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            functions = list(self._functions.items())
+        return [
+            f"{self.name}{self._labels(dict(key))} {function()}"
+            for key, function in functions
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # per-bucket counts, then sum and count
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self) -> list[str]:
+        lines = []
+        with self._lock:
+            for key, series in self._series.items():
+                labels = dict(key)
+                for bound, count in zip(self.buckets, series):
+                    bucket = self._labels({**labels, "le": bound})
+                    lines.append(f"{self.name}_bucket{bucket} {count}")
+                inf = self._labels({**labels, "le": "+Inf"})
+                lines.append(f"{self.name}_bucket{inf} {series[-1]}")
+                lines.append(f"{self.name}_sum{self._labels(labels)} {series[-2]}")
+                lines.append(f"{self.name}_count{self._labels(labels)} {series[-1]}")
+        return lines
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "Request latency by route and status"
+)
+request_statements = Histogram(
+    "http_request_db_statements",
+    "SQL statements executed per request",
+    buckets=COUNT_BUCKETS,
+)
+request_db_time = Histogram(
+    "http_request_db_seconds", "Time spent executing SQL per request"
+)
+statement_duration = Histogram(
+    "db_statement_duration_seconds", "Latency of individual SQL statements"
+)
+pool_checkout_wait = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection"
+)
+password_queue_wait = Histogram(
+    "password_hash_queue_wait_seconds", "Time bcrypt jobs wait for a worker"
+)
+password_duration = Histogram(
+    "password_hash_duration_seconds", "Time spent hashing or verifying a password"
+)
+pool_checked_out = Gauge(
+    "db_pool_checked_out", "Connections currently checked out of the pool"
+)
+password_pending = Gauge("password_hash_pending", "bcrypt jobs queued or running")
+password_rejected = Counter(
+    "password_hash_rejected_total", "bcrypt jobs refused because the pool was full"
+)
+requests_in_flight = Gauge(
+    "http_requests_in_flight", "Requests admitted and not yet answered"
+)
+requests_rejected = Counter(
+    "http_requests_rejected_total", "Requests refused by rate limiting or load shedding"
+)
+
+
+class RequestStats:
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+
+
+# set by the request middleware; sync work in the threadpool and async
+# engine greenlets both run in a copy of the request's context
+current_request: ContextVar[RequestStats | None] = ContextVar(
+    "current_request", default=None
+)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    conn.info.setdefault("statement_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    elapsed = time.perf_counter() - conn.info["statement_started"].pop()
+    statement_duration.observe(elapsed)
+    stats = current_request.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_seconds += elapsed
+
+
+def _handle_error(context) -> None:
+    started = context.connection.info.get("statement_started")
+    if started:
+        started.pop()
+
+
+def instrument_engine(engine: Engine, name: str) -> None:
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+    pool_checked_out.set_function(
+        lambda: getattr(engine.pool, "checkedout", lambda: 0)(), engine=name
+    )
+
+
+def timed_pool(pool_class: type) -> type:
+    # no pool event fires before a checkout starts waiting, so the wait is
+    # measured around the pool's own acquisition step
+    class TimedPool(pool_class):
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                pool_checkout_wait.observe(time.perf_counter() - started)
+
+    TimedPool.__name__ = f"Timed{pool_class.__name__}"
+    return TimedPool
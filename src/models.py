@@ -5,14 +5,27 @@ from sqlalchemy import (
     Column,
     Integer,
     String,
-    Float,
+    Numeric,
     ForeignKey,
+    Date,
     DateTime,
     Enum,
+    Index,
+    UniqueConstraint,
+)
+from src.schemas import (
+    BASE_CURRENCY,
+    ExpenseCategory,
+    Frequency,
+    IncomeSource,
+    JobKind,
+    JobStatus,
 )
-from src.schemas import ExpenseCategory, IncomeSource
 from sqlalchemy.orm import relationship
 
+# exact amounts, to four places so converted values keep sub-cent precision
+Amount = Numeric(18, 4)
+
 # class ExpenseCategory(Base):
 #     __tablename__ = 'expense_categories'
 
@@ -47,28 +60,214 @@ class Expense(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     date = Column(DateTime, nullable=False, default=datetime.utcnow)
-    amount = Column(Float, nullable=False)
+    amount = Column(Amount, nullable=False)
+    currency = Column(String(3), nullable=False, default=BASE_CURRENCY)
     description = Column(String, nullable=False)
     category = Column(Enum(ExpenseCategory), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"))
+    # sha of date, amount, currency and description,
+    # see src.idempotency.content_hash
+    content_hash = Column(String, nullable=True)
     # category = relationship("ExpenseCategory", back_populates="expenses")
 
     owner = relationship("User", back_populates="items")
 
+    __table_args__ = (
+        Index("ix_expenses_user_id_date_id", "user_id", "date", "id"),
+        Index("ix_expenses_user_id_amount_id", "user_id", "amount", "id"),
+        Index("ix_expenses_user_id_content_hash", "user_id", "content_hash"),
+    )
+
 
 class Income(Base):
     __tablename__ = "incomes"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     date = Column(DateTime, nullable=False, default=datetime.utcnow)
-    amount = Column(Float, nullable=False)
+    amount = Column(Amount, nullable=False)
+    currency = Column(String(3), nullable=False, default=BASE_CURRENCY)
     description = Column(String, nullable=False)
     source = Column(Enum(IncomeSource), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"))
+    # sha of date, amount, currency and description,
+    # see src.idempotency.content_hash
+    content_hash = Column(String, nullable=True)
     # source = relationship("IncomeSource", back_populates="incomes")
 
     owner = relationship("User", back_populates="incomes")
 
+    __table_args__ = (
+        Index("ix_incomes_user_id_date_id", "user_id", "date", "id"),
+        Index("ix_incomes_user_id_amount_id", "user_id", "amount", "id"),
+        Index("ix_incomes_user_id_content_hash", "user_id", "content_hash"),
+    )
+
+
+class ExpenseRollup(Base):
+    __tablename__ = "expense_rollups"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    month = Column(Date, nullable=False)
+    category = Column(Enum(ExpenseCategory), nullable=False)
+    currency = Column(String(3), nullable=False)
+    total = Column(Amount, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+    min = Column(Amount)
+    max = Column(Amount)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id", "month", "category", "currency", name="uq_expense_rollups_bucket"
+        ),
+    )
+
+
+class IncomeRollup(Base):
+    __tablename__ = "income_rollups"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    month = Column(Date, nullable=False)
+    source = Column(Enum(IncomeSource), nullable=False)
+    currency = Column(String(3), nullable=False)
+    total = Column(Amount, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+    min = Column(Amount)
+    max = Column(Amount)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id", "month", "source", "currency", name="uq_income_rollups_bucket"
+        ),
+    )
+
+
+class CollectionVersion(Base):
+    __tablename__ = "collection_versions"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    collection = Column(String, nullable=False)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id", "collection", name="uq_collection_versions_user_collection"
+        ),
+    )
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(String, nullable=False)
+    fingerprint = Column(String, nullable=False)
+    # set once the first request has finished
+    status_code = Column(Integer)
+    response = Column(String)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_key"),
+    )
+
+
+class RecurringExpense(Base):
+    __tablename__ = "recurring_expenses"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    amount = Column(Amount, nullable=False)
+    currency = Column(String(3), nullable=False, default=BASE_CURRENCY)
+    description = Column(String, nullable=False)
+    category = Column(Enum(ExpenseCategory), nullable=False)
+    frequency = Column(Enum(Frequency), nullable=False)
+    interval = Column(Integer, nullable=False, default=1)
+    starts_at = Column(DateTime, nullable=False)
+    until = Column(DateTime)
+    count = Column(Integer)
+    # occurrences stored as expenses so far, and when the next one is due;
+    # next_at is None once the schedule has run out
+    materialized = Column(Integer, nullable=False, default=0)
+    next_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_recurring_expenses_next_at", "next_at"),
+        Index("ix_recurring_expenses_user_id_id", "user_id", "id"),
+    )
+
+
+class RecurringIncome(Base):
+    __tablename__ = "recurring_incomes"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    amount = Column(Amount, nullable=False)
+    currency = Column(String(3), nullable=False, default=BASE_CURRENCY)
+    description = Column(String, nullable=False)
+    source = Column(Enum(IncomeSource), nullable=False)
+    frequency = Column(Enum(Frequency), nullable=False)
+    interval = Column(Integer, nullable=False, default=1)
+    starts_at = Column(DateTime, nullable=False)
+    until = Column(DateTime)
+    count = Column(Integer)
+    # occurrences stored as incomes so far, and when the next one is due;
+    # next_at is None once the schedule has run out
+    materialized = Column(Integer, nullable=False, default=0)
+    next_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_recurring_incomes_next_at", "next_at"),
+        Index("ix_recurring_incomes_user_id_id", "user_id", "id"),
+    )
+
+
+# value of one unit of currency in the base currency from date on, loaded
+# from CSV with `python -m src.fx load`
+class FxRate(Base):
+    __tablename__ = "fx_rates"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    currency = Column(String(3), nullable=False)
+    date = Column(Date, nullable=False)
+    rate = Column(Numeric(18, 8), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("currency", "date", name="uq_fx_rates_currency_date"),
+    )
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    kind = Column(Enum(JobKind), nullable=False)
+    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.QUEUED)
+    # JSON documents; params may hold a whole import
+    params = Column(String, nullable=False)
+    result = Column(String)
+    error = Column(String)
+    # rows done, and the position a restarted job resumes from
+    processed = Column(Integer, nullable=False, default=0)
+    total = Column(Integer)
+    checkpoint = Column(Integer, nullable=False, default=0)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_jobs_status_id", "status", "id"),
+        Index("ix_jobs_user_id_id", "user_id", "id"),
+    )
+
 
 # ExpenseCategory.expenses = relationship("Expense", order_by=Expense.id, back_populates="category")
 # IncomeSource.incomes = relationship("Income", order_by=Income.id, back_populates="source")
@@ -0,0 +1,39 @@
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from fastapi import HTTPException, status
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def _jsonable(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        # as a string, so the cursor keeps the exact value
+        return str(value)
+    return value
+
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps([_jsonable(value) for value in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, types: list[type]) -> tuple:
+    # types are the python types of the sort keys the cursor was built from
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if len(values) != len(types):
+            raise ValueError("Cursor does not match the requested ordering")
+        return tuple(
+            kind.fromisoformat(value) if kind is datetime else kind(value)
+            for kind, value in zip(types, values)
+        )
+    except (ValueError, TypeError, InvalidOperation):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
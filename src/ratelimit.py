@@ -0,0 +1,191 @@
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from decouple import config
+from fastapi import HTTPException, Request, status
+from starlette.concurrency import run_in_threadpool
+from src import metrics
+from src.helpers import TokenHandler
+
+# token buckets: each client holds up to RATE_LIMIT_BURST tokens, refilled at
+# RATE_LIMIT_PER_SECOND, and every request spends its route's cost
+RATE_LIMIT_ENABLED = config("RATE_LIMIT_ENABLED", default=True, cast=bool)
+RATE_LIMIT_BURST = config("RATE_LIMIT_BURST", default=60, cast=float)
+RATE_LIMIT_PER_SECOND = config("RATE_LIMIT_PER_SECOND", default=5, cast=float)
+RATE_LIMIT_URL = config("RATE_LIMIT_URL", default=config("CACHE_URL", default=None))
+
+DEFAULT_COST = config("RATE_LIMIT_DEFAULT_COST", default=1, cast=float)
+# bcrypt on login and registration
+PASSWORD_COST = config("RATE_LIMIT_PASSWORD_COST", default=10, cast=float)
+# list, search, report and export scans
+SCAN_COST = config("RATE_LIMIT_SCAN_COST", default=5, cast=float)
+IMPORT_COST = config("RATE_LIMIT_IMPORT_COST", default=10, cast=float)
+
+# by method and route template, anything else costs DEFAULT_COST
+ROUTE_COSTS = {
+    ("GET", "/metrics"): 0,
+    ("POST", "/users/register"): PASSWORD_COST,
+    ("POST", "/users/token"): PASSWORD_COST,
+    ("GET", "/users/all"): SCAN_COST,
+    ("POST", "/users/batch/deactivate"): SCAN_COST,
+    ("POST", "/users/batch/reactivate"): SCAN_COST,
+    ("GET", "/expenses/"): SCAN_COST,
+    ("GET", "/expenses/export"): SCAN_COST,
+    ("GET", "/expenses/projected"): SCAN_COST,
+    ("POST", "/expenses/bulk"): IMPORT_COST,
+    ("PATCH", "/expenses/batch"): SCAN_COST,
+    ("POST", "/expenses/batch/delete"): SCAN_COST,
+    ("GET", "/incomes/"): SCAN_COST,
+    ("GET", "/incomes/export"): SCAN_COST,
+    ("GET", "/incomes/projected"): SCAN_COST,
+    ("POST", "/incomes/bulk"): IMPORT_COST,
+    ("PATCH", "/incomes/batch"): SCAN_COST,
+    ("POST", "/incomes/batch/delete"): SCAN_COST,
+    ("GET", "/reports/summary"): SCAN_COST,
+    ("POST", "/jobs/"): IMPORT_COST,
+}
+
+# in-flight requests across the process before new ones are shed with a 503
+MAX_CONCURRENT_REQUESTS = config("MAX_CONCURRENT_REQUESTS", default=200, cast=int)
+SHED_RETRY_AFTER = config("SHED_RETRY_AFTER_SECONDS", default=1, cast=int)
+
+
+# take() spends cost from key's bucket and returns 0, or leaves the bucket
+# alone and returns the seconds until the cost would be covered. take_async
+# is for the event loop, a blocking backend is called through the threadpool
+class RateLimitBackend(ABC):
+    blocking = False
+
+    @abstractmethod
+    def take(self, key: str, cost: float, burst: float, rate: float) -> float: ...
+
+    async def take_async(
+        self, key: str, cost: float, burst: float, rate: float
+    ) -> float:
+        if self.blocking:
+            return await run_in_threadpool(self.take, key, cost, burst, rate)
+        return self.take(key, cost, burst, rate)
+
+
+# per-process buckets; evicting an idle bucket only hands its client a full one
+class MemoryRateLimit(RateLimitBackend):
+    def __init__(self, maxsize: int = 100_000):
+        self.maxsize = maxsize
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, cost: float, burst: float, rate: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+# shared between workers so a client can't multiply its budget by the
+# process count; the refill and spend run atomically in one script
+class RedisRateLimit(RateLimitBackend):
+    blocking = True
+    SCRIPT = """
+    local burst, rate, cost, now =
+        tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or burst
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+    local wait = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+    else
+        wait = (cost - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+    return tostring(wait)
+    """
+
+    def __init__(self, url: str, prefix: str):
+        # only needed when RATE_LIMIT_URL or CACHE_URL is configured
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(self.SCRIPT)
+
+    def take(self, key: str, cost: float, burst: float, rate: float) -> float:
+        return float(
+            self._take(keys=[self.prefix + key], args=[burst, rate, cost, time.time()])
+        )
+
+
+def build_rate_limit() -> RateLimitBackend:
+    if RATE_LIMIT_URL:
+        return RedisRateLimit(RATE_LIMIT_URL, prefix="finapp:ratelimit:")
+    return MemoryRateLimit(
+        maxsize=config("RATE_LIMIT_BUCKETS", default=100_000, cast=int)
+    )
+
+
+buckets = build_rate_limit()
+
+
+def _client_key(request: Request) -> str:
+    # signed-in users get a bucket of their own wherever they connect from,
+    # everyone else shares one per address
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            return "user:" + TokenHandler.decode_token(token).username
+        except HTTPException:
+            pass
+    return "ip:" + (request.client.host if request.client else "unknown")
+
+
+async def enforce(request: Request) -> None:
+    if not RATE_LIMIT_ENABLED:
+        return
+    route = request.scope["route"]
+    cost = ROUTE_COSTS.get((request.method, route.path), DEFAULT_COST)
+    if not cost:
+        return
+    wait = await buckets.take_async(
+        _client_key(request), cost, RATE_LIMIT_BURST, RATE_LIMIT_PER_SECOND
+    )
+    if wait:
+        metrics.requests_rejected.inc(reason="rate_limit", route=route.path)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded, retry later",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+
+
+# admission control; only the event loop touches it, so no lock
+class ConcurrencyLimit:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+
+    def acquire(self) -> bool:
+        if self.active >= self.limit:
+            return False
+        self.active += 1
+        return True
+
+    def release(self) -> None:
+        self.active -= 1
+
+
+in_flight = ConcurrencyLimit(MAX_CONCURRENT_REQUESTS)
+metrics.requests_in_flight.set_function(lambda: in_flight.active)
@@ -0,0 +1,292 @@
+import argparse
+import asyncio
+import calendar
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Iterator
+from decouple import config
+from fastapi import HTTPException, status
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from src import fx, idempotency, models, rollups, versions
+from src.dbconfig import SessionLocal
+from src.schemas import Frequency, RecurringBase, ReportPeriod, UserRead
+
+# seconds between scheduler passes in each process, 0 leaves materializing
+# to `python -m src.recurring materialize` run from cron
+RECURRING_SCHEDULER_SECONDS = config(
+    "RECURRING_SCHEDULER_SECONDS", default=300, cast=float
+)
+# due rules materialized per transaction
+RECURRING_BATCH_SIZE = config("RECURRING_BATCH_SIZE", default=500, cast=int)
+# projected occurrences one read may expand
+RECURRING_MAX_OCCURRENCES = config(
+    "RECURRING_MAX_OCCURRENCES", default=10_000, cast=int
+)
+
+# record model -> rule model and its category or source column
+RULES = {
+    models.Expense: (models.RecurringExpense, "category"),
+    models.Income: (models.RecurringIncome, "source"),
+}
+STEPS = {Frequency.DAILY: timedelta(days=1), Frequency.WEEKLY: timedelta(weeks=1)}
+MONTHS = {Frequency.MONTHLY: 1, Frequency.YEARLY: 12}
+
+logger = logging.getLogger("uvicorn.error")
+
+_scheduler: asyncio.Task | None = None
+
+
+def _add_months(value: datetime, months: int) -> datetime:
+    month = value.month - 1 + months
+    year = value.year + month // 12
+    month = month % 12 + 1
+    day = min(value.day, calendar.monthrange(year, month)[1])
+    return value.replace(year=year, month=month, day=day)
+
+
+def occurrence(rule, index: int) -> datetime | None:
+    # the index-th occurrence, None past the end of the schedule. Each one
+    # is counted from starts_at, so a rule on the 31st lands on the last day
+    # of shorter months without drifting to the 28th afterwards
+    if rule.count is not None and index >= rule.count:
+        return None
+    if rule.frequency in MONTHS:
+        months = index * rule.interval * MONTHS[rule.frequency]
+        when = _add_months(rule.starts_at, months)
+    else:
+        when = rule.starts_at + index * rule.interval * STEPS[rule.frequency]
+    if rule.until is not None and when > rule.until:
+        return None
+    return when
+
+
+def _first_index(rule, start: datetime) -> int:
+    # lowest index whose occurrence is at or after start, estimated from the
+    # step so a long running rule isn't walked from its first occurrence
+    if start <= rule.starts_at:
+        return 0
+    if rule.frequency in MONTHS:
+        months = (start.year - rule.starts_at.year) * 12
+        months += start.month - rule.starts_at.month
+        index = max(months // (rule.interval * MONTHS[rule.frequency]) - 1, 0)
+    else:
+        index = int((start - rule.starts_at) / (rule.interval * STEPS[rule.frequency]))
+    while (when := occurrence(rule, index)) is not None and when < start:
+        index += 1
+    return index
+
+
+def expand(rule, start: datetime, end: datetime) -> Iterator[tuple[int, datetime]]:
+    # occurrences in [start, end) that aren't stored as records yet
+    index = max(rule.materialized, _first_index(rule, start))
+    while (when := occurrence(rule, index)) is not None and when < end:
+        yield index, when
+        index += 1
+
+
+def _record(rule, key: str, when: datetime) -> dict:
+    return {
+        "user_id": rule.user_id,
+        "date": when,
+        "amount": rule.amount,
+        "currency": rule.currency,
+        "description": rule.description,
+        key: getattr(rule, key),
+    }
+
+
+def projected(
+    db: Session, record_model, user_id: int, start: datetime | None, end: datetime
+) -> list[dict]:
+    # expanded on read and never stored; only rules with an occurrence
+    # due before end are loaded
+    rule_model, key = RULES[record_model]
+    rules = db.scalars(
+        select(rule_model).where(
+            rule_model.user_id == user_id,
+            rule_model.next_at.is_not(None),
+            rule_model.next_at < end,
+        )
+    )
+    occurrences = []
+    for rule in rules:
+        for _, when in expand(rule, start or rule.starts_at, end):
+            if len(occurrences) >= RECURRING_MAX_OCCURRENCES:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Too many projected occurrences, narrow the date range",
+                )
+            occurrences.append({"rule_id": rule.id, **_record(rule, key, when)})
+    occurrences.sort(key=lambda item: (item["date"], item["rule_id"]))
+    return occurrences
+
+
+def projected_buckets(
+    db: Session,
+    record_model,
+    user_id: int,
+    period: ReportPeriod,
+    start: datetime | None,
+    end: datetime,
+) -> list[tuple]:
+    # projected occurrences in the (period, group, currency, total, count,
+    # min, max) shape the summary folds stored buckets in
+    _, key = RULES[record_model]
+    buckets = {}
+    for item in projected(db, record_model, user_id, start, end):
+        bucket_id = (
+            rollups.period_label(item["date"], period),
+            item[key],
+            item["currency"],
+        )
+        amount = Decimal(item["amount"])
+        bucket = buckets.get(bucket_id)
+        if bucket is None:
+            buckets[bucket_id] = [amount, 1, amount, amount]
+            continue
+        bucket[0] += amount
+        bucket[1] += 1
+        bucket[2] = min(bucket[2], amount)
+        bucket[3] = max(bucket[3], amount)
+    return [(*bucket_id, *bucket) for bucket_id, bucket in buckets.items()]
+
+
+def describe(rule, key: str) -> dict:
+    return {
+        "id": rule.id,
+        "amount": rule.amount,
+        "description": rule.description,
+        "currency": rule.currency,
+        key: getattr(rule, key),
+        "frequency": rule.frequency,
+        "interval": rule.interval,
+        "starts_at": rule.starts_at,
+        "until": rule.until,
+        "count": rule.count,
+        "materialized": rule.materialized,
+        "next_at": rule.next_at,
+    }
+
+
+def create_rule(db: Session, record_model, rule: RecurringBase, user: UserRead) -> dict:
+    # occurrences already due are stored by the next scheduler pass
+    fx.require_rate(db, rule.currency)
+    rule_model, key = RULES[record_model]
+    rule_obj = rule_model(**rule.model_dump(), user_id=user.id, materialized=0)
+    rule_obj.next_at = occurrence(rule_obj, 0)
+    db.add(rule_obj)
+    db.commit()
+    db.refresh(rule_obj)
+    return describe(rule_obj, key)
+
+
+def list_rules(db: Session, record_model, user: UserRead) -> list[dict]:
+    rule_model, key = RULES[record_model]
+    rules = db.scalars(
+        select(rule_model).where(rule_model.user_id == user.id).order_by(rule_model.id)
+    )
+    return [describe(rule, key) for rule in rules]
+
+
+def delete_rule(db: Session, record_model, rule_id: int, user: UserRead) -> None:
+    # records it already materialized are kept
+    rule_model, _ = RULES[record_model]
+    rule_obj = db.scalar(
+        select(rule_model).where(
+            rule_model.id == rule_id, rule_model.user_id == user.id
+        )
+    )
+    if rule_obj is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Recurring rule not found"
+        )
+    db.delete(rule_obj)
+    db.commit()
+
+
+def materialize_due(
+    db: Session, now: datetime | None = None, batch_size: int = RECURRING_BATCH_SIZE
+) -> int:
+    # stores every occurrence due by now as a record, a batch of rules per
+    # transaction with one multi-row INSERT and one rollup upsert per bucket
+    now = now or datetime.utcnow()
+    created = 0
+    for record_model, (rule_model, key) in RULES.items():
+        while True:
+            rules = db.scalars(
+                select(rule_model)
+                .where(rule_model.next_at <= now)
+                .order_by(rule_model.next_at)
+                .limit(batch_size)
+            ).all()
+            if not rules:
+                break
+            rows = defaultdict(list)
+            for rule in rules:
+                index, due = rule.materialized, []
+                while (when := occurrence(rule, index)) is not None and when <= now:
+                    values = _record(rule, key, when)
+                    values["content_hash"] = idempotency.content_hash(values)
+                    due.append(values)
+                    index += 1
+                # claimed by moving the rule on from the state it was read
+                # in, so another process materializing at once skips it
+                claimed = db.execute(
+                    update(rule_model)
+                    .where(
+                        rule_model.id == rule.id,
+                        rule_model.materialized == rule.materialized,
+                    )
+                    .values(materialized=index, next_at=occurrence(rule, index))
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                if claimed:
+                    rows[rule.user_id].extend(due)
+            for user_id, user_rows in rows.items():
+                db.execute(insert(record_model), user_rows)
+                rollups.add_many(db, record_model, user_id, user_rows)
+                versions.bump(db, record_model, user_id)
+                created += len(user_rows)
+            db.commit()
+    return created
+
+
+def _materialize() -> int:
+    with SessionLocal() as session:
+        return materialize_due(session)
+
+
+async def _run_scheduler() -> None:
+    while True:
+        try:
+            created = await run_in_threadpool(_materialize)
+            if created:
+                logger.info("recurring: materialized %s records", created)
+        except Exception:
+            logger.exception("materializing recurring records failed")
+        await asyncio.sleep(RECURRING_SCHEDULER_SECONDS)
+
+
+async def start() -> None:
+    global _scheduler
+    if RECURRING_SCHEDULER_SECONDS > 0:
+        _scheduler = asyncio.create_task(_run_scheduler())
+
+
+async def stop() -> None:
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.cancel()
+        _scheduler = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain recurring records")
+    parser.add_argument("command", choices=["materialize"])
+    args = parser.parse_args()
+
+    print(f"materialized {_materialize()} records")
@@ -0,0 +1,336 @@
+import argparse
+import math
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Iterable
+from sqlalchemy import delete, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+from src import models, schemas, statements
+
+# record model -> (rollup model, name of the bucket column); buckets are
+# also split by currency so totals never mix them
+ROLLUPS = {
+    models.Expense: (models.ExpenseRollup, "category"),
+    models.Income: (models.IncomeRollup, "source"),
+}
+
+
+def month_of(value: datetime | date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def next_month(month: date) -> date:
+    if month.month == 12:
+        return date(month.year + 1, 1, 1)
+    return date(month.year, month.month + 1, 1)
+
+
+def period_bucket(column, period: schemas.ReportPeriod, dialect: str):
+    # every bucket is labelled with the ISO date it starts on, weeks on Monday
+    if dialect == "sqlite":
+        if period == schemas.ReportPeriod.DAY:
+            return func.strftime("%Y-%m-%d", column)
+        if period == schemas.ReportPeriod.WEEK:
+            return func.date(column, "weekday 0", "-6 days")
+        return func.strftime("%Y-%m-01", column)
+    return func.to_char(func.date_trunc(period.value, column), "YYYY-MM-DD")
+
+
+def period_label(value: datetime, period: schemas.ReportPeriod) -> str:
+    # python side of period_bucket, for amounts that aren't in the database
+    day = value.date()
+    if period == schemas.ReportPeriod.DAY:
+        return day.isoformat()
+    if period == schemas.ReportPeriod.WEEK:
+        return (day - timedelta(days=day.weekday())).isoformat()
+    return month_of(day).isoformat()
+
+
+def _bucket_filter(
+    rollup, key: str, user_id: int, month: date, value, currency: str
+) -> tuple:
+    return (
+        rollup.user_id == user_id,
+        rollup.month == month,
+        getattr(rollup, key) == value,
+        rollup.currency == currency,
+    )
+
+
+def _upsert(db: Session, rollup, key: str, values: dict) -> None:
+    if db.get_bind().dialect.name == "sqlite":
+        # sqlite's multi-argument min()/max() are scalar, not aggregates
+        least, greatest = func.min, func.max
+    else:
+        least, greatest = func.least, func.greatest
+    statements.upsert(
+        db,
+        rollup,
+        [values],
+        ["user_id", "month", key, "currency"],
+        lambda new: {
+            "total": rollup.total + new.total,
+            "count": rollup.count + new.count,
+            "min": least(rollup.min, new.min),
+            "max": greatest(rollup.max, new.max),
+        },
+    )
+
+
+def add(
+    db: Session,
+    record_model,
+    user_id: int,
+    when: datetime,
+    value,
+    currency: str,
+    amount: Decimal,
+) -> None:
+    rollup, key = ROLLUPS[record_model]
+    _upsert(
+        db,
+        rollup,
+        key,
+        {
+            "user_id": user_id,
+            "month": month_of(when),
+            key: value,
+            "currency": currency,
+            "total": amount,
+            "count": 1,
+            "min": amount,
+            "max": amount,
+        },
+    )
+
+
+def add_many(db: Session, record_model, user_id: int, rows: Iterable[dict]) -> None:
+    rollup, key = ROLLUPS[record_model]
+    buckets = {}
+    for row in rows:
+        bucket_id = (month_of(row["date"]), row[key], row["currency"])
+        amount = row["amount"]
+        bucket = buckets.get(bucket_id)
+        if bucket is None:
+            buckets[bucket_id] = [amount, 1, amount, amount]
+            continue
+        bucket[0] += amount
+        bucket[1] += 1
+        bucket[2] = min(bucket[2], amount)
+        bucket[3] = max(bucket[3], amount)
+    for (month, value, currency), (total, count, low, high) in buckets.items():
+        _upsert(
+            db,
+            rollup,
+            key,
+            {
+                "user_id": user_id,
+                "month": month,
+                key: value,
+                "currency": currency,
+                "total": total,
+                "count": count,
+                "min": low,
+                "max": high,
+            },
+        )
+
+
+def remove(
+    db: Session,
+    record_model,
+    user_id: int,
+    when: datetime,
+    value,
+    currency: str,
+    amount: Decimal,
+) -> None:
+    # must run after the record change has been flushed, so that a min/max
+    # recomputation sees the bucket as it is without the removed amount.
+    rollup, key = ROLLUPS[record_model]
+    month = month_of(when)
+    bucket_filter = _bucket_filter(rollup, key, user_id, month, value, currency)
+    db.execute(
+        update(rollup)
+        .where(*bucket_filter)
+        .values(total=rollup.total - amount, count=rollup.count - 1)
+    )
+    bucket = db.execute(
+        select(rollup.count, rollup.min, rollup.max).where(*bucket_filter)
+    ).one_or_none()
+    if bucket is None:
+        return
+    if bucket.count <= 0:
+        db.execute(delete(rollup).where(*bucket_filter))
+    elif amount <= bucket.min or amount >= bucket.max:
+        low, high = db.execute(
+            select(func.min(record_model.amount), func.max(record_model.amount)).where(
+                record_model.user_id == user_id,
+                getattr(record_model, key) == value,
+                record_model.currency == currency,
+                record_model.date >= month,
+                record_model.date < next_month(month),
+            )
+        ).one()
+        db.execute(update(rollup).where(*bucket_filter).values(min=low, max=high))
+
+
+def _source_buckets(
+    db: Session, record_model, user_id: int | None, months: Iterable[date] = None
+):
+    _, key = ROLLUPS[record_model]
+    month = period_bucket(
+        record_model.date, schemas.ReportPeriod.MONTH, db.get_bind().dialect.name
+    )
+    key_column = getattr(record_model, key)
+    statement = select(
+        record_model.user_id,
+        month.label("month"),
+        key_column,
+        record_model.currency,
+        func.sum(record_model.amount).label("total"),
+        func.count(record_model.id).label("count"),
+        func.min(record_model.amount).label("min"),
+        func.max(record_model.amount).label("max"),
+    ).group_by(record_model.user_id, month, key_column, record_model.currency)
+    if user_id is not None:
+        statement = statement.where(record_model.user_id == user_id)
+    if months is not None:
+        statement = statement.where(
+            or_(
+                *(
+                    (record_model.date >= month)
+                    & (record_model.date < next_month(month))
+                    for month in months
+                )
+            )
+        )
+    for row in db.execute(statement.execution_options(yield_per=1000)):
+        yield {
+            "user_id": row.user_id,
+            "month": date.fromisoformat(row.month),
+            key: row[2],
+            "currency": row.currency,
+            "total": row.total,
+            "count": row.count,
+            "min": row.min,
+            "max": row.max,
+        }
+
+
+def months_of(db: Session, record_model, criteria: list) -> set[date]:
+    # the months holding the records matched by criteria, read before a
+    # bulk statement changes or removes them
+    month = period_bucket(
+        record_model.date, schemas.ReportPeriod.MONTH, db.get_bind().dialect.name
+    )
+    return {
+        date.fromisoformat(value)
+        for value in db.scalars(select(month).where(*criteria).distinct())
+    }
+
+
+def refresh(db: Session, record_model, user_id: int, months: set[date]) -> None:
+    # recomputes a user's buckets for the given months from the base table,
+    # for bulk statements where per-row add/remove bookkeeping is too costly
+    if not months:
+        return
+    rollup, _ = ROLLUPS[record_model]
+    db.execute(
+        delete(rollup).where(rollup.user_id == user_id, rollup.month.in_(months))
+    )
+    buckets = list(_source_buckets(db, record_model, user_id, months))
+    if buckets:
+        db.execute(insert(rollup), buckets)
+
+
+def rebuild(db: Session, user_id: int = None) -> int:
+    written = 0
+    for record_model, (rollup, _) in ROLLUPS.items():
+        statement = delete(rollup)
+        if user_id is not None:
+            statement = statement.where(rollup.user_id == user_id)
+        db.execute(statement)
+        batch = []
+        for bucket in _source_buckets(db, record_model, user_id):
+            batch.append(bucket)
+            if len(batch) >= 1000:
+                db.execute(insert(rollup), batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            db.execute(insert(rollup), batch)
+            written += len(batch)
+    db.commit()
+    return written
+
+
+def check(db: Session, user_id: int = None) -> list[dict]:
+    mismatches = []
+    for record_model, (rollup, key) in ROLLUPS.items():
+        expected = {
+            (b["user_id"], b["month"], b[key], b["currency"]): b
+            for b in _source_buckets(db, record_model, user_id)
+        }
+        statement = select(rollup)
+        if user_id is not None:
+            statement = statement.where(rollup.user_id == user_id)
+        actual = {}
+        for bucket in db.scalars(statement):
+            bucket_id = (
+                bucket.user_id,
+                bucket.month,
+                getattr(bucket, key),
+                bucket.currency,
+            )
+            actual[bucket_id] = {
+                "total": bucket.total,
+                "count": bucket.count,
+                "min": bucket.min,
+                "max": bucket.max,
+            }
+        empty = defaultdict(lambda: None, count=0, total=0.0)
+        for bucket_id in expected.keys() | actual.keys():
+            want = expected.get(bucket_id, empty)
+            have = actual.get(bucket_id, empty)
+            if want["count"] != have["count"] or not all(
+                _close(want[field], have[field]) for field in ("total", "min", "max")
+            ):
+                mismatches.append(
+                    {
+                        "table": rollup.__tablename__,
+                        "user_id": bucket_id[0],
+                        "month": bucket_id[1].isoformat(),
+                        key: str(bucket_id[2]),
+                        "currency": bucket_id[3],
+                        "expected": {k: want[k] for k in ("total", "count")},
+                        "actual": {k: have[k] for k in ("total", "count")},
+                    }
+                )
+    return mismatches
+
+
+def _close(a: Decimal | None, b: Decimal | None) -> bool:
+    if a is None or b is None:
+        return a is b
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6)
+
+
+if __name__ == "__main__":
+    from src.dbconfig import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Maintain the monthly rollup tables")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    parser.add_argument("--user-id", type=int, default=None)
+    args = parser.parse_args()
+
+    with SessionLocal() as session:
+        if args.command == "rebuild":
+            print(f"wrote {rebuild(session, args.user_id)} rollup buckets")
+        else:
+            problems = check(session, args.user_id)
+            for problem in problems:
+                print(problem)
+            print(f"{len(problems)} inconsistent rollup buckets")
+            raise SystemExit(1 if problems else 0)
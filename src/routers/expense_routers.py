@@ -1,9 +1,17 @@
-from fastapi import APIRouter, status, Depends
-from sqlalchemy.orm import Session
-from src import schemas, dbconfig, crud
-from typing import Annotated, List
+from fastapi import APIRouter, Header, Query, Request, Response, status, Depends
+from fastapi.responses import StreamingResponse
+from src import schemas, dbconfig, crud, idempotency, ingest, models, recurring
+from src.conditional import not_modified
+from src.export import MEDIA_TYPES
+from src.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from src.serialization import page_projection, parse_fields, render
+from typing import Annotated
 
-from src.helpers import get_current_active_user
+from src.helpers import (
+    get_current_active_user,
+    get_read_session,
+    get_write_session,
+)
 
 router = APIRouter(prefix="/expenses", tags=["Expenses"])
 
@@ -11,14 +19,149 @@ router = APIRouter(prefix="/expenses", tags=["Expenses"])
 @router.get(
     "/",
     status_code=status.HTTP_200_OK,
-    response_model=List[schemas.ExpenseRead],
+    response_model=schemas.ExpensePage,
 )
 async def get_or_search_all_expenses(
     current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
-    db: Annotated[Session, Depends(dbconfig.get_db_session)],
+    db: Annotated[dbconfig.DBSession, Depends(get_read_session)],
+    request: Request,
+    response: Response,
+    ranges: Annotated[schemas.RangeFilter, Depends()],
     query: str = None,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    cursor: str = None,
+    category: Annotated[list[schemas.ExpenseCategory], Query()] = None,
+    sort: schemas.ListSort = schemas.ListSort.DATE,
+    fields: Annotated[
+        str, Query(description="Comma separated fields to return, e.g. id,amount,date")
+    ] = None,
+    display_currency: Annotated[
+        schemas.Currency, Query(description="Convert amounts to this currency")
+    ] = None,
+):
+    selected = parse_fields(fields, schemas.ExpenseRead)
+    cached = await not_modified(
+        request,
+        response,
+        db,
+        current_user,
+        models.Expense,
+        display_currency is not None,
+    )
+    if cached is not None:
+        return cached
+    return await db.run_sync(
+        lambda session: render(
+            page_projection(schemas.ExpensePage, selected),
+            crud.get_expenses(
+                session,
+                current_user,
+                query,
+                limit,
+                cursor,
+                category,
+                sort,
+                selected,
+                ranges,
+                display_currency,
+            ),
+            headers=response.headers,
+        )
+    )
+
+
+@router.get(
+    "/export",
+    tags=["Expenses"],
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+)
+async def export_expenses(
+    current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
+    format: schemas.ExportFormat = schemas.ExportFormat.NDJSON,
+):
+    return StreamingResponse(
+        crud.export_expenses(current_user, format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="expenses.{format}"'},
+    )
+
+
+@router.get(
+    "/projected",
+    tags=["Expenses"],
+    status_code=status.HTTP_200_OK,
+    response_model=list[schemas.ExpenseOccurrence],
+)
+async def get_projected_expenses(
+    current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
+    db: Annotated[dbconfig.DBSession, Depends(get_read_session)],
+    date_to: schemas.UtcDatetime,
+    date_from: schemas.UtcDatetime = None,
 ):
-    return crud.get_expenses(db, current_user, query)
+    return await db.run_sync(
+        lambda session: render(
+            list[schemas.ExpenseOccurrence],
+            recurring.projected(
+                session, models.Expense, current_user.id, date_from, date_to
+            ),
+        )
+    )
+
+
+@router.get(
+    "/recurring",
+    tags=["Expenses"],
+    status_code=status.HTTP_200_OK,
+    response_model=list[schemas.RecurringExpenseRead],
+)
+async def get_recurring_expenses(
+    current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
+    db: Annotated[dbconfig.DBSession, Depends(get_read_session)],
+):
+    return await db.run_sync(
+        lambda session: render(
+            list[schemas.RecurringExpenseRead],
+            recurring.list_rules(session, models.Expense, current_user),
+        )
+    )
+
+
+@router.post(
+    "/recurring",
+    tags=["Expenses"],
+    status_code=status.HTTP_201_CREATED,
+    response_model=schemas.RecurringExpenseRead,
+)
+async def create_recurring_expense(
+    current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
+    db: Annotated[dbconfig.DBSession, Depends(get_write_session)],
+    rule: schemas.RecurringExpenseCreate,
+):
+    return await db.run_sync(
+        lambda session: render(
+            schemas.RecurringExpenseRead,
+            recurring.create_rule(session, models.Expense, rule, current_user),
+            status_code=status.HTTP_201_CREATED,
+        )
+    )
+
+
+@router.delete(
+    "/recurring/{rule_id}",
+    tags=["Expenses"],
+    status_code=status.HTTP_204_NO_CONTENT,
+)
+async def delete_recurring_expense(
+    current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
+    db: Annotated[dbconfig.DBSession, Depends(get_write_session)],
+    rule_id: int,
+):
+    await db.run_sync(
+        lambda session: recurring.delete_rule(
+            session, models.Expense, rule_id, current_user
+        )
+    )
 
 
 @router.get(
@@ -29,10 +172,31 @@ async def get_or_search_all_expenses(
 )
 async def get_expense(
     current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
-    db: Annotated[Session, Depends(dbconfig.get_db_session)],
+    db: Annotated[dbconfig.DBSession, Depends(get_read_session)],
+    request: Request,
+    response: Response,
     expense_id: int,
+    display_currency: Annotated[
+        schemas.Currency, Query(description="Convert the amount to this currency")
+    ] = None,
 ):
-    return crud.get_expense_by_id(expense_id, db, current_user)
+    cached = await not_modified(
+        request,
+        response,
+        db,
+        current_user,
+        models.Expense,
+        display_currency is not None,
+    )
+    if cached is not None:
+        return cached
+    return await db.run_sync(
+        lambda session: render(
+            schemas.ExpenseRead,
+            crud.get_expense_by_id(expense_id, session, current_user, display_currency),
+            headers=response.headers,
+        )
+    )
 
 
 @router.post(
@@ -43,10 +207,93 @@ async def get_expense(
 )
 async def create_expense(
     current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
-    db: Annotated[Session, Depends(dbconfig.get_db_session)],
+    db: Annotated[dbconfig.DBSession, Depends(get_write_session)],
     expense: schemas.ExpenseBase,
+    idempotency_key: Annotated[str, Header(max_length=255)] = None,
+):
+    return await db.run_sync(
+        lambda session: idempotency.run(
+            session,
+            current_user,
+            idempotency_key,
+            idempotency.fingerprint("create_expense", expense.model_dump(mode="json")),
+            lambda: render(
+                schemas.ExpenseRead,
+                crud.create_expense(expense, session, current_user),
+                status_code=status.HTTP_201_CREATED,
+            ),
+        )
+    )
+
+
+@router.post(
+    "/bulk",
+    tags=["Expenses"],
+    status_code=status.HTTP_201_CREATED,
+    response_model=schemas.BulkResult,
+)
+async def bulk_create_expenses(
+    current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
+    db: Annotated[dbconfig.DBSession, Depends(get_write_session)],
+    request: Request,
+    batch_size: Annotated[
+        int, Query(ge=1, le=ingest.MAX_BATCH_SIZE)
+    ] = ingest.DEFAULT_BATCH_SIZE,
+    dedupe: Annotated[
+        bool, Query(description="Skip rows with the same date, amount and description")
+    ] = False,
+    idempotency_key: Annotated[str, Header(max_length=255)] = None,
+):
+    # only buffered in full when a key needs the body fingerprinted
+    digest = await idempotency.body_digest(request) if idempotency_key else None
+    records = await ingest.read_records(request)
+    return await db.run_sync(
+        lambda session: idempotency.run(
+            session,
+            current_user,
+            idempotency_key,
+            idempotency.fingerprint("bulk_create_expenses", batch_size, dedupe, digest),
+            lambda: render(
+                schemas.BulkResult,
+                crud.bulk_create_expenses(
+                    records, session, current_user, batch_size, dedupe
+                ),
+                status_code=status.HTTP_201_CREATED,
+            ),
+        )
+    )
+
+
+@router.patch(
+    "/batch",
+    tags=["Expenses"],
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.BatchResult,
+)
+async def batch_edit_expenses(
+    current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
+    db: Annotated[dbconfig.DBSession, Depends(get_write_session)],
+    batch: schemas.ExpenseBatchUpdate,
+):
+    return await db.run_sync(
+        lambda session: crud.batch_update_expenses(batch, session, current_user)
+    )
+
+
+@router.post(
+    "/batch/delete",
+    tags=["Expenses"],
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.BatchResult,
+)
+async def batch_delete_expenses(
+    current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
+    db: Annotated[dbconfig.DBSession, Depends(get_write_session)],
+    batch_filter: schemas.ExpenseFilter,
 ):
-    return crud.create_expense(expense, db, current_user)
+    return await db.run_sync(
+        lambda session: crud.batch_delete_expenses(batch_filter, session, current_user)
+    )
 
 
 @router.patch(
@@ -57,8 +304,13 @@ async def create_expense(
 )
 async def edit_expense(
     current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
-    db: Annotated[Session, Depends(dbconfig.get_db_session)],
+    db: Annotated[dbconfig.DBSession, Depends(get_write_session)],
     expense_id: int,
     expense: schemas.ExpenseUpdate,
 ):
-    return crud.update_expense(expense_id, expense, db, current_user)
+    return await db.run_sync(
+        lambda session: render(
+            schemas.ExpenseRead,
+            crud.update_expense(expense_id, expense, session, current_user),
+        )
+    )
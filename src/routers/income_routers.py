@@ -1,9 +1,16 @@
-from fastapi import APIRouter, status, Depends
-from sqlalchemy.orm import Session
-from src import schemas, dbconfig, crud
+from fastapi import APIRouter, Header, Query, Request, Response, status, Depends
+from fastapi.responses import StreamingResponse
+from src import schemas, dbconfig, crud, idempotency, ingest, models, recurring
+from src.conditional import not_modified
+from src.export import MEDIA_TYPES
+from src.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from src.serialization import page_projection, parse_fields, render
 from typing import Annotated
-from src.helpers import get_current_active_user
-
+from src.helpers import (
+    get_current_active_user,
+    get_read_session,
+    get_write_session,
+)
 
 router = APIRouter(prefix="/incomes", tags=["Income"])
 
@@ -11,14 +18,144 @@ router = APIRouter(prefix="/incomes", tags=["Income"])
 @router.get(
     "/",
     status_code=status.HTTP_200_OK,
-    response_model=list[schemas.IncomeRead],
+    response_model=schemas.IncomePage,
 )
 async def get_all_incomes(
     current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
-    db: Annotated[Session, Depends(dbconfig.get_db_session)],
+    db: Annotated[dbconfig.DBSession, Depends(get_read_session)],
+    request: Request,
+    response: Response,
+    ranges: Annotated[schemas.RangeFilter, Depends()],
     query: str = None,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    cursor: str = None,
+    source: Annotated[list[schemas.IncomeSource], Query()] = None,
+    sort: schemas.ListSort = schemas.ListSort.DATE,
+    fields: Annotated[
+        str, Query(description="Comma separated fields to return, e.g. id,amount,date")
+    ] = None,
+    display_currency: Annotated[
+        schemas.Currency, Query(description="Convert amounts to this currency")
+    ] = None,
+):
+    selected = parse_fields(fields, schemas.IncomeRead)
+    cached = await not_modified(
+        request, response, db, current_user, models.Income, display_currency is not None
+    )
+    if cached is not None:
+        return cached
+    return await db.run_sync(
+        lambda session: render(
+            page_projection(schemas.IncomePage, selected),
+            crud.get_income_records(
+                session,
+                current_user,
+                query,
+                limit,
+                cursor,
+                source,
+                sort,
+                selected,
+                ranges,
+                display_currency,
+            ),
+            headers=response.headers,
+        )
+    )
+
+
+@router.get(
+    "/export",
+    tags=["Income"],
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+)
+async def export_incomes(
+    current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
+    format: schemas.ExportFormat = schemas.ExportFormat.NDJSON,
+):
+    return StreamingResponse(
+        crud.export_income_records(current_user, format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="incomes.{format}"'},
+    )
+
+
+@router.get(
+    "/projected",
+    tags=["Income"],
+    status_code=status.HTTP_200_OK,
+    response_model=list[schemas.IncomeOccurrence],
+)
+async def get_projected_incomes(
+    current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
+    db: Annotated[dbconfig.DBSession, Depends(get_read_session)],
+    date_to: schemas.UtcDatetime,
+    date_from: schemas.UtcDatetime = None,
+):
+    return await db.run_sync(
+        lambda session: render(
+            list[schemas.IncomeOccurrence],
+            recurring.projected(
+                session, models.Income, current_user.id, date_from, date_to
+            ),
+        )
+    )
+
+
+@router.get(
+    "/recurring",
+    tags=["Income"],
+    status_code=status.HTTP_200_OK,
+    response_model=list[schemas.RecurringIncomeRead],
+)
+async def get_recurring_incomes(
+    current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
+    db: Annotated[dbconfig.DBSession, Depends(get_read_session)],
+):
+    return await db.run_sync(
+        lambda session: render(
+            list[schemas.RecurringIncomeRead],
+            recurring.list_rules(session, models.Income, current_user),
+        )
+    )
+
+
+@router.post(
+    "/recurring",
+    tags=["Income"],
+    status_code=status.HTTP_201_CREATED,
+    response_model=schemas.RecurringIncomeRead,
+)
+async def create_recurring_income(
+    current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
+    db: Annotated[dbconfig.DBSession, Depends(get_write_session)],
+    rule: schemas.RecurringIncomeCreate,
+):
+    return await db.run_sync(
+        lambda session: render(
+            schemas.RecurringIncomeRead,
+            recurring.create_rule(session, models.Income, rule, current_user),
+            status_code=status.HTTP_201_CREATED,
+        )
+    )
+
+
+@router.delete(
+    "/recurring/{rule_id}",
+    tags=["Income"],
+    status_code=status.HTTP_204_NO_CONTENT,
+)
+async def delete_recurring_income(
+    current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
+    db: Annotated[dbconfig.DBSession, Depends(get_write_session)],
+    rule_id: int,
 ):
-    return crud.get_income_records(db, current_user, query)
+    await db.run_sync(
+        lambda session: recurring.delete_rule(
+            session, models.Income, rule_id, current_user
+        )
+    )
 
 
 @router.get(
@@ -29,10 +166,28 @@ async def get_all_incomes(
 )
 async def get_income(
     current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
-    db: Annotated[Session, Depends(dbconfig.get_db_session)],
+    db: Annotated[dbconfig.DBSession, Depends(get_read_session)],
+    request: Request,
+    response: Response,
     income_id: int,
+    display_currency: Annotated[
+        schemas.Currency, Query(description="Convert the amount to this currency")
+    ] = None,
 ):
-    return crud.get_income_record_by_id(income_id, db, current_user)
+    cached = await not_modified(
+        request, response, db, current_user, models.Income, display_currency is not None
+    )
+    if cached is not None:
+        return cached
+    return await db.run_sync(
+        lambda session: render(
+            schemas.IncomeRead,
+            crud.get_income_record_by_id(
+                income_id, session, current_user, display_currency
+            ),
+            headers=response.headers,
+        )
+    )
 
 
 @router.post(
@@ -43,10 +198,99 @@ async def get_income(
 )
 async def record_income(
     current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
-    db: Annotated[Session, Depends(dbconfig.get_db_session)],
+    db: Annotated[dbconfig.DBSession, Depends(get_write_session)],
     income: schemas.IncomeBase,
+    idempotency_key: Annotated[str, Header(max_length=255)] = None,
+):
+    return await db.run_sync(
+        lambda session: idempotency.run(
+            session,
+            current_user,
+            idempotency_key,
+            idempotency.fingerprint(
+                "create_income_record", income.model_dump(mode="json")
+            ),
+            lambda: render(
+                schemas.IncomeRead,
+                crud.create_income_record(income, session, current_user),
+                status_code=status.HTTP_201_CREATED,
+            ),
+        )
+    )
+
+
+@router.post(
+    "/bulk",
+    tags=["Income"],
+    status_code=status.HTTP_201_CREATED,
+    response_model=schemas.BulkResult,
+)
+async def bulk_create_incomes(
+    current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
+    db: Annotated[dbconfig.DBSession, Depends(get_write_session)],
+    request: Request,
+    batch_size: Annotated[
+        int, Query(ge=1, le=ingest.MAX_BATCH_SIZE)
+    ] = ingest.DEFAULT_BATCH_SIZE,
+    dedupe: Annotated[
+        bool, Query(description="Skip rows with the same date, amount and description")
+    ] = False,
+    idempotency_key: Annotated[str, Header(max_length=255)] = None,
+):
+    # only buffered in full when a key needs the body fingerprinted
+    digest = await idempotency.body_digest(request) if idempotency_key else None
+    records = await ingest.read_records(request)
+    return await db.run_sync(
+        lambda session: idempotency.run(
+            session,
+            current_user,
+            idempotency_key,
+            idempotency.fingerprint(
+                "bulk_create_income_records", batch_size, dedupe, digest
+            ),
+            lambda: render(
+                schemas.BulkResult,
+                crud.bulk_create_income_records(
+                    records, session, current_user, batch_size, dedupe
+                ),
+                status_code=status.HTTP_201_CREATED,
+            ),
+        )
+    )
+
+
+@router.patch(
+    "/batch",
+    tags=["Income"],
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.BatchResult,
+)
+async def batch_edit_income_records(
+    current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
+    db: Annotated[dbconfig.DBSession, Depends(get_write_session)],
+    batch: schemas.IncomeBatchUpdate,
+):
+    return await db.run_sync(
+        lambda session: crud.batch_update_income_records(batch, session, current_user)
+    )
+
+
+@router.post(
+    "/batch/delete",
+    tags=["Income"],
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.BatchResult,
+)
+async def batch_delete_income_records(
+    current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
+    db: Annotated[dbconfig.DBSession, Depends(get_write_session)],
+    batch_filter: schemas.IncomeFilter,
 ):
-    return crud.create_income_record(income, db, current_user)
+    return await db.run_sync(
+        lambda session: crud.batch_delete_income_records(
+            batch_filter, session, current_user
+        )
+    )
 
 
 @router.patch(
@@ -57,8 +301,13 @@ async def record_income(
 )
 async def edit_income_record(
     current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
-    db: Annotated[Session, Depends(dbconfig.get_db_session)],
+    db: Annotated[dbconfig.DBSession, Depends(get_write_session)],
     income_id: int,
     income: schemas.IncomeUpdate,
 ):
-    return crud.update_income_record(income_id, income, db, current_user)
+    return await db.run_sync(
+        lambda session: render(
+            schemas.IncomeRead,
+            crud.update_income_record(income_id, income, session, current_user),
+        )
+    )
@@ -0,0 +1,105 @@
+from fastapi import APIRouter, Query, Request, status, Depends
+from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
+from src import schemas, dbconfig, ingest, jobs
+from src.export import MEDIA_TYPES
+from typing import Annotated
+
+from src.helpers import get_current_active_user, get_write_session
+
+# job reads stay on the primary, where the workers record progress; a
+# replica would report it late
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+
+@router.post(
+    "/",
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=schemas.JobRead,
+)
+async def submit_job(
+    current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
+    db: Annotated[dbconfig.DBSession, Depends(get_write_session)],
+    request: Request,
+    kind: schemas.JobKind,
+    format: schemas.ExportFormat = schemas.ExportFormat.NDJSON,
+    batch_size: Annotated[
+        int, Query(ge=1, le=ingest.MAX_BATCH_SIZE)
+    ] = ingest.DEFAULT_BATCH_SIZE,
+    dedupe: bool = False,
+):
+    params = {}
+    if kind in jobs.IMPORTS:
+        records = await ingest.read_records(request)
+        # uploads are read lazily from disk, materialize them off the loop
+        params = {
+            "records": await run_in_threadpool(jobs.encode_records, records),
+            "batch_size": batch_size,
+            "dedupe": dedupe,
+        }
+    elif kind in jobs.EXPORTS:
+        params = {"format": format}
+    job = await db.run_sync(
+        lambda session: jobs.submit(session, current_user, kind, params)
+    )
+    jobs.notify()
+    return job
+
+
+@router.get(
+    "/",
+    status_code=status.HTTP_200_OK,
+    response_model=list[schemas.JobRead],
+)
+async def list_jobs(
+    current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
+    db: Annotated[dbconfig.DBSession, Depends(dbconfig.get_db_session)],
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+):
+    return await db.run_sync(
+        lambda session: jobs.list_jobs(session, current_user, limit)
+    )
+
+
+@router.get(
+    "/{job_id}",
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.JobRead,
+)
+async def get_job(
+    current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
+    db: Annotated[dbconfig.DBSession, Depends(dbconfig.get_db_session)],
+    job_id: int,
+):
+    return await db.run_sync(lambda session: jobs.get(session, current_user, job_id))
+
+
+@router.post(
+    "/{job_id}/cancel",
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.JobRead,
+)
+async def cancel_job(
+    current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
+    db: Annotated[dbconfig.DBSession, Depends(dbconfig.get_db_session)],
+    job_id: int,
+):
+    return await db.run_sync(lambda session: jobs.cancel(session, current_user, job_id))
+
+
+@router.get(
+    "/{job_id}/download",
+    status_code=status.HTTP_200_OK,
+    response_class=FileResponse,
+)
+async def download_job_result(
+    current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
+    db: Annotated[dbconfig.DBSession, Depends(dbconfig.get_db_session)],
+    job_id: int,
+):
+    path, fmt = await db.run_sync(
+        lambda session: jobs.download(session, current_user, job_id)
+    )
+    return FileResponse(
+        path, media_type=MEDIA_TYPES[fmt], filename=f"job-{job_id}.{fmt}"
+    )
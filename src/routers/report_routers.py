@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Query, status, Depends
+from src import schemas, dbconfig, crud
+from typing import Annotated
+from src.helpers import get_current_active_user, get_read_session
+
+router = APIRouter(prefix="/reports", tags=["Reports"])
+
+
+@router.get(
+    "/summary",
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.Summary,
+)
+async def get_summary(
+    current_user: Annotated[schemas.UserRead, Depends(get_current_active_user)],
+    db: Annotated[dbconfig.DBSession, Depends(get_read_session)],
+    period: schemas.ReportPeriod = schemas.ReportPeriod.MONTH,
+    date_from: schemas.UtcDatetime = None,
+    date_to: schemas.UtcDatetime = None,
+    display_currency: Annotated[
+        schemas.Currency, Query(description="Currency every amount is reported in")
+    ] = schemas.BASE_CURRENCY,
+    include_projected: Annotated[
+        bool, Query(description="Add recurring occurrences not stored yet")
+    ] = False,
+):
+    return await db.run_sync(
+        lambda session: crud.get_summary(
+            session,
+            current_user,
+            period,
+            date_from,
+            date_to,
+            display_currency,
+            include_projected,
+        )
+    )
@@ -1,17 +1,20 @@
 from typing import Annotated
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi import APIRouter, HTTPException, status, Depends
-from src.crud import fetch_user_by_name
+from fastapi import APIRouter, HTTPException, Query, status, Depends
+from src import crud
 from src.helpers import (
     PasswordHandler,
     TokenHandler,
     authenticate_user,
     get_current_active_user,
+    get_current_admin_user,
+    get_read_session,
+    get_write_session,
 )
-from src.models import User
-from src.schemas import Token, UserCreate, UserRead
-from sqlalchemy.orm import Session
-from src.dbconfig import get_db_session
+from src.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from src.schemas import BatchResult, Token, UserBatch, UserCreate, UserPage, UserRead
+from src.serialization import page_projection, parse_fields, render
+from src.dbconfig import DBSession, get_db_session, mark_write
 
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -19,20 +22,19 @@ router = APIRouter(prefix="/users", tags=["users"])
 
 @router.post("/register", status_code=status.HTTP_201_CREATED, response_model=UserRead)
 async def register_new_user(
-    user: UserCreate, db: Annotated[Session, Depends(get_db_session)]
+    user: UserCreate, db: Annotated[DBSession, Depends(get_db_session)]
 ) -> UserRead:
-    user_obj = User(**user.model_dump())
-    user_obj.password = PasswordHandler.get_password_hash(user_obj.password)
-    db.add(user_obj)
-    db.commit()
-    db.refresh(user_obj)
-    return user_obj
+    hashed_password = await PasswordHandler.get_password_hash_async(user.password)
+    await mark_write(user.username)
+    return await db.run_sync(
+        lambda session: crud.create_user(user, hashed_password, session)
+    )
 
 
 @router.post("/token", response_model=Token)
 async def login_for_access_token(
     user_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    db: Annotated[Session, Depends(get_db_session)],
+    db: Annotated[DBSession, Depends(get_db_session)],
 ):
     user = await authenticate_user(
         username=user_data.username, password=user_data.password, db=db
@@ -55,28 +57,69 @@ async def get_logged_in_user(
     return current_user
 
 
-@router.get("/all", status_code=status.HTTP_200_OK, response_model=list[UserRead])
+@router.get("/all", status_code=status.HTTP_200_OK, response_model=UserPage)
 async def fetch_all_users(
-    current_user: Annotated[UserRead, Depends(get_current_active_user)],
-    db: Annotated[Session, Depends(get_db_session)],
+    current_user: Annotated[UserRead, Depends(get_current_admin_user)],
+    db: Annotated[DBSession, Depends(get_read_session)],
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    cursor: str = None,
+    disabled: bool = None,
+    fields: Annotated[
+        str, Query(description="Comma separated fields to return, e.g. id,username")
+    ] = None,
 ):
-    if current_user.username != "admin":
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, detail="Not allowed!"
+    selected = parse_fields(fields, UserRead)
+    return await db.run_sync(
+        lambda session: render(
+            page_projection(UserPage, selected),
+            crud.get_users(session, limit, cursor, disabled, selected),
         )
-    users = db.query(User).all()
-    return users
+    )
+
+
+async def _set_users_disabled(
+    batch: UserBatch, disabled: bool, db: DBSession
+) -> BatchResult:
+    # keeps the users' own reads on the primary so they see the change
+    await mark_write(*batch.usernames)
+    return await db.run_sync(
+        lambda session: crud.set_users_disabled(batch.usernames, disabled, session)
+    )
+
+
+@router.post(
+    "/batch/deactivate", status_code=status.HTTP_200_OK, response_model=BatchResult
+)
+async def deactivate_users(
+    batch: UserBatch,
+    current_user: Annotated[UserRead, Depends(get_current_admin_user)],
+    db: Annotated[DBSession, Depends(get_write_session)],
+):
+    return await _set_users_disabled(batch, True, db)
+
+
+@router.post(
+    "/batch/reactivate", status_code=status.HTTP_200_OK, response_model=BatchResult
+)
+async def reactivate_users(
+    batch: UserBatch,
+    current_user: Annotated[UserRead, Depends(get_current_admin_user)],
+    db: Annotated[DBSession, Depends(get_write_session)],
+):
+    return await _set_users_disabled(batch, False, db)
 
 
 @router.delete("/{username}", status_code=status.HTTP_200_OK)
 async def deactivate_user(
     username: str,
-    db: Annotated[Session, Depends(get_db_session)],
+    db: Annotated[DBSession, Depends(get_db_session)],
     current_user: Annotated[UserRead, Depends(get_current_active_user)],
 ):
-    user = await fetch_user_by_name(username, db)
-    user.disabled = True
-    db.commit()
+    # users may close their own account, anyone else's is the admin's call
+    if username != current_user.username:
+        await get_current_admin_user(current_user)
+    await mark_write(username)
+    await db.run_sync(lambda session: crud.deactivate_user(username, session))
     return {"msg": f"{username} has been deactivated by {current_user.username}"}
 
 
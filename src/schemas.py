@@ -1,7 +1,34 @@
-from typing import Optional
-from pydantic import BaseModel
-from datetime import datetime
+from typing import Annotated, Optional
+from pydantic import (
+    AfterValidator,
+    BaseModel,
+    PlainSerializer,
+    StringConstraints,
+    model_validator,
+)
+from datetime import datetime, timezone
+from decimal import Decimal
 from enum import StrEnum
+from decouple import config
+
+# currency of records that don't name one, and of converted reports
+BASE_CURRENCY = config("BASE_CURRENCY", default="USD")
+
+# ISO 4217 code
+Currency = Annotated[str, StringConstraints(pattern=r"^[A-Z]{3}$")]
+# exact in python and in the database, a plain JSON number on the wire
+Money = Annotated[Decimal, PlainSerializer(float, return_type=float, when_used="json")]
+
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+# datetimes are stored as naive UTC; offsets sent by clients are applied so
+# they compare with stored values instead of raising
+UtcDatetime = Annotated[datetime, AfterValidator(_naive_utc)]
 
 
 # Enum for ExpenseCategory
@@ -22,6 +49,53 @@ class IncomeSource(StrEnum):
     OTHER = "Other"
 
 
+# Enum for export file formats
+class ExportFormat(StrEnum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+# Enum for list orderings
+class ListSort(StrEnum):
+    DATE = "date"
+    DATE_ASC = "date_asc"
+    AMOUNT = "amount"
+    AMOUNT_ASC = "amount_asc"
+    RELEVANCE = "relevance"
+
+
+# Enum for report period buckets
+class ReportPeriod(StrEnum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+
+
+# Enum for recurring rule schedules
+class Frequency(StrEnum):
+    DAILY = "daily"
+    WEEKLY = "weekly"
+    MONTHLY = "monthly"
+    YEARLY = "yearly"
+
+
+# Enums for background jobs
+class JobKind(StrEnum):
+    EXPENSE_IMPORT = "expense_import"
+    INCOME_IMPORT = "income_import"
+    EXPENSE_EXPORT = "expense_export"
+    INCOME_EXPORT = "income_export"
+    ROLLUP_REBUILD = "rollup_rebuild"
+
+
+class JobStatus(StrEnum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
 # Token schema
 class Token(BaseModel):
     access_token: str
@@ -47,11 +121,21 @@ class UserRead(UserBase):
     id: int
 
 
+class UserPage(BaseModel):
+    items: list[UserRead]
+    next_cursor: Optional[str] = None
+
+
+class UserBatch(BaseModel):
+    usernames: list[str]
+
+
 # Pydantic model for Expense
 class ExpenseBase(BaseModel):
-    amount: float
+    amount: Money
     description: str
     category: Optional[ExpenseCategory] = ExpenseCategory.OTHER
+    currency: Currency = BASE_CURRENCY
 
 
 class ExpenseRead(ExpenseBase):
@@ -59,17 +143,28 @@ class ExpenseRead(ExpenseBase):
     id: int
 
 
+class ExpensePage(BaseModel):
+    items: list[ExpenseRead]
+    next_cursor: Optional[str] = None
+
+
+class ExpenseImport(ExpenseBase):
+    date: Optional[UtcDatetime] = None
+
+
 class ExpenseUpdate(BaseModel):
-    amount: Optional[float] = 0.0
+    amount: Optional[Money] = 0.0
     description: Optional[str | None] = None
     category: Optional[ExpenseCategory] = ExpenseCategory.OTHER
+    currency: Optional[Currency] = None
 
 
 # Pydantic model for Income
 class IncomeBase(BaseModel):
-    amount: float
+    amount: Money
     description: str
     source: Optional[IncomeSource] = IncomeSource.OTHER
+    currency: Currency = BASE_CURRENCY
 
 
 class IncomeRead(IncomeBase):
@@ -77,7 +172,217 @@ class IncomeRead(IncomeBase):
     id: int
 
 
+class IncomePage(BaseModel):
+    items: list[IncomeRead]
+    next_cursor: Optional[str] = None
+
+
+class IncomeImport(IncomeBase):
+    date: Optional[UtcDatetime] = None
+
+
 class IncomeUpdate(BaseModel):
-    amount: Optional[float] = 0.0
+    amount: Optional[Money] = 0.0
     description: Optional[str | None] = None
     source: Optional[IncomeSource] = IncomeSource.OTHER
+    currency: Optional[Currency] = None
+
+
+# Pydantic model for recurring rules, an RRULE-style schedule of FREQ,
+# INTERVAL, DTSTART and an optional UNTIL or COUNT
+class RecurringBase(BaseModel):
+    amount: Money
+    description: str
+    currency: Currency = BASE_CURRENCY
+    frequency: Frequency
+    interval: int = 1
+    starts_at: UtcDatetime
+    until: Optional[UtcDatetime] = None
+    count: Optional[int] = None
+
+    @model_validator(mode="after")
+    def valid_schedule(self):
+        if self.interval < 1:
+            raise ValueError("interval must be at least 1")
+        if self.count is not None and self.count < 1:
+            raise ValueError("count must be at least 1")
+        if self.until is not None and self.until < self.starts_at:
+            raise ValueError("until must not be before starts_at")
+        return self
+
+
+class RecurringExpenseCreate(RecurringBase):
+    category: Optional[ExpenseCategory] = ExpenseCategory.OTHER
+
+
+class RecurringExpenseRead(RecurringExpenseCreate):
+    id: int
+    materialized: int
+    next_at: Optional[datetime] = None
+
+
+class RecurringIncomeCreate(RecurringBase):
+    source: Optional[IncomeSource] = IncomeSource.OTHER
+
+
+class RecurringIncomeRead(RecurringIncomeCreate):
+    id: int
+    materialized: int
+    next_at: Optional[datetime] = None
+
+
+# occurrences of a rule that are not stored yet
+class ExpenseOccurrence(BaseModel):
+    rule_id: int
+    date: datetime
+    amount: Money
+    currency: Currency
+    description: str
+    category: ExpenseCategory
+
+
+class IncomeOccurrence(BaseModel):
+    rule_id: int
+    date: datetime
+    amount: Money
+    currency: Currency
+    description: str
+    source: IncomeSource
+
+
+# Pydantic model for list range filters, date_to is exclusive
+class RangeFilter(BaseModel):
+    date_from: Optional[UtcDatetime] = None
+    date_to: Optional[UtcDatetime] = None
+    min_amount: Optional[Decimal] = None
+    max_amount: Optional[Decimal] = None
+
+
+# Pydantic model for batch mutations; a filter selects the caller's records
+# matching every criterion given, ids included
+class BatchFilter(RangeFilter):
+    ids: Optional[list[int]] = None
+    description_contains: Optional[str] = None
+
+    @model_validator(mode="after")
+    def has_criteria(self):
+        # an empty id list or substring would match every record the user has
+        if self.ids == []:
+            raise ValueError("ids must not be empty")
+        if self.description_contains == "":
+            raise ValueError("description_contains must not be empty")
+        # None and an empty category or source list don't narrow anything
+        if all(value is None or value == [] for value in self.model_dump().values()):
+            raise ValueError("a batch filter needs at least one criterion")
+        return self
+
+
+class ExpenseFilter(BatchFilter):
+    category: Optional[list[ExpenseCategory]] = None
+
+
+class IncomeFilter(BatchFilter):
+    source: Optional[list[IncomeSource]] = None
+
+
+class ExpensePatch(ExpenseUpdate):
+    id: int
+
+
+class IncomePatch(IncomeUpdate):
+    id: int
+
+
+class _BatchUpdate(BaseModel):
+    # either per-record patches, or one set of values for a filter
+    @model_validator(mode="after")
+    def one_mode(self):
+        if (self.updates is None) == (self.filter is None):
+            raise ValueError("send exactly one of updates or filter")
+        if self.filter is not None and (
+            self.set is None
+            or not self.set.model_dump(exclude_unset=True, exclude_none=True)
+        ):
+            raise ValueError("a filter update needs the values to set")
+        return self
+
+
+class ExpenseBatchUpdate(_BatchUpdate):
+    updates: Optional[list[ExpensePatch]] = None
+    filter: Optional[ExpenseFilter] = None
+    set: Optional[ExpenseUpdate] = None
+
+
+class IncomeBatchUpdate(_BatchUpdate):
+    updates: Optional[list[IncomePatch]] = None
+    filter: Optional[IncomeFilter] = None
+    set: Optional[IncomeUpdate] = None
+
+
+class BatchResult(BaseModel):
+    matched: int
+    affected: int
+
+
+# Pydantic model for bulk imports
+class BulkRowError(BaseModel):
+    row: int
+    error: str
+
+
+class BulkResult(BaseModel):
+    inserted: int
+    duplicates: int = 0
+    failed: int
+    errors: list[BulkRowError]
+    elapsed_seconds: float
+    rows_per_second: float
+
+
+# Pydantic model for Reports
+class AggregateStats(BaseModel):
+    total: Money
+    count: int
+    min: Optional[Money] = None
+    max: Optional[Money] = None
+    avg: Optional[Money] = None
+
+
+class CategoryStats(AggregateStats):
+    category: ExpenseCategory
+
+
+class SourceStats(AggregateStats):
+    source: IncomeSource
+
+
+class PeriodStats(BaseModel):
+    period: str
+    expenses: AggregateStats
+    incomes: AggregateStats
+    net: Money
+
+
+class Summary(BaseModel):
+    currency: Currency
+    expenses: AggregateStats
+    incomes: AggregateStats
+    net_cash_flow: Money
+    by_category: list[CategoryStats]
+    by_source: list[SourceStats]
+    by_period: list[PeriodStats]
+
+
+# Pydantic model for background jobs
+class JobRead(BaseModel):
+    id: int
+    kind: JobKind
+    status: JobStatus
+    processed: int
+    total: Optional[int] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    cancel_requested: bool
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
@@ -0,0 +1,94 @@
+import re
+from sqlalchemy import Connection, column, func, literal_column, table, text
+from sqlalchemy.orm import Query
+
+
+# searchable tables; each gets a full-text index over its description
+TABLES = ("expenses", "incomes")
+
+_SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts
+        USING fts5(description, content='{table}', content_rowid='id')
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+        INSERT INTO {table}_fts(rowid, description) VALUES (new.id, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+        INSERT INTO {table}_fts({table}_fts, rowid, description)
+            VALUES ('delete', old.id, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {table}_fts_update
+        AFTER UPDATE OF description ON {table} BEGIN
+        INSERT INTO {table}_fts({table}_fts, rowid, description)
+            VALUES ('delete', old.id, old.description);
+        INSERT INTO {table}_fts(rowid, description) VALUES (new.id, new.description);
+    END
+    """,
+]
+
+_POSTGRES_DDL = """
+CREATE INDEX IF NOT EXISTS ix_{table}_description_fts
+    ON {table} USING gin (to_tsvector('simple', description))
+"""
+
+
+def owns(name: str | None) -> bool:
+    # the fts5 tables with their shadow tables, and the postgres gin indexes
+    return name is not None and any(
+        name.startswith(f"{table}_fts") or name == f"ix_{table}_description_fts"
+        for table in TABLES
+    )
+
+
+def install(connection: Connection) -> None:
+    # idempotent, so it is safe to run on every start up after create_all
+    dialect = connection.dialect.name
+    for name in TABLES:
+        if dialect == "sqlite":
+            exists = connection.execute(
+                text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+                {"name": f"{name}_fts"},
+            ).first()
+            for statement in _SQLITE_DDL:
+                connection.execute(text(statement.format(table=name)))
+            if not exists:
+                # index whatever was stored before the search table existed
+                connection.execute(
+                    text(f"INSERT INTO {name}_fts({name}_fts) VALUES ('rebuild')")
+                )
+        elif dialect == "postgresql":
+            connection.execute(text(_POSTGRES_DDL.format(table=name)))
+
+
+def tokens(query: str) -> list[str]:
+    return re.findall(r"\w+", query.lower())
+
+
+def apply(query: Query, model, search: str, dialect: str) -> tuple[Query, object]:
+    # filters the query to rows whose description contains every term (as a
+    # prefix) and returns it with a rank expression where lower is better
+    terms = tokens(search)
+    if not terms:
+        return query, None
+    if dialect == "sqlite":
+        name = f"{model.__tablename__}_fts"
+        fts = table(name, column("rowid"))
+        match = " ".join(f'"{term}"*' for term in terms)
+        query = query.join(fts, fts.c.rowid == model.id).filter(
+            literal_column(name).op("MATCH")(match)
+        )
+        return query, func.bm25(literal_column(name))
+    if dialect == "postgresql":
+        document = func.to_tsvector("simple", model.description)
+        tsquery = func.to_tsquery("simple", " & ".join(f"{t}:*" for t in terms))
+        query = query.filter(document.op("@@")(tsquery))
+        return query, -func.ts_rank(document, tsquery)
+    for term in terms:
+        query = query.filter(model.description.icontains(term))
+    return query, None
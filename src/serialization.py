@@ -0,0 +1,65 @@
+from functools import lru_cache
+from typing import Optional
+from fastapi import HTTPException, Response, status
+from pydantic import BaseModel, TypeAdapter, create_model
+
+
+@lru_cache(maxsize=None)
+def adapter(schema) -> TypeAdapter:
+    # building an adapter compiles its validator and serializer, do it once
+    return TypeAdapter(schema)
+
+
+def render(
+    schema,
+    content,
+    status_code: int = status.HTTP_200_OK,
+    headers=None,
+) -> Response:
+    # validates ORM objects or result rows by attribute and dumps JSON bytes
+    # in one pass, returning a ready response so FastAPI neither runs
+    # jsonable_encoder nor validates against the response_model again
+    schema_adapter = adapter(schema)
+    body = schema_adapter.dump_json(
+        schema_adapter.validate_python(content, from_attributes=True)
+    )
+    return Response(
+        body, status_code=status_code, headers=headers, media_type="application/json"
+    )
+
+
+def parse_fields(fields: str | None, schema: type[BaseModel]) -> tuple[str, ...] | None:
+    # comma separated field names, returned in the schema's own order so
+    # equivalent requests share a projected model
+    if not fields:
+        return None
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested - schema.model_fields.keys()
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}",
+        )
+    return tuple(name for name in schema.model_fields if name in requested) or None
+
+
+@lru_cache(maxsize=256)
+def page_projection(
+    page: type[BaseModel], fields: tuple[str, ...] | None
+) -> type[BaseModel]:
+    # a copy of the page schema whose items only carry the selected fields
+    if fields is None:
+        return page
+    item = page.model_fields["items"].annotation.__args__[0]
+    projected = create_model(
+        f"{item.__name__}Fields",
+        **{
+            name: (item.model_fields[name].annotation, item.model_fields[name])
+            for name in fields
+        },
+    )
+    return create_model(
+        f"{page.__name__}Fields",
+        items=(list[projected], ...),
+        next_cursor=(Optional[str], None),
+    )
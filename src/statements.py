@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+from typing import Callable
+from sqlalchemy import insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+
+def upsert(
+    db: Session,
+    table,
+    rows: list[dict],
+    index_elements: list[str],
+    set_: Callable[[object], dict],
+) -> None:
+    # INSERT .. ON CONFLICT DO UPDATE where the dialect has one, otherwise an
+    # UPDATE per row followed by an INSERT when it matched nothing. set_ maps
+    # the incoming row, as excluded or as the row's own values, to the
+    # columns a conflicting row gets
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        module = postgresql if dialect == "postgresql" else sqlite
+        statement = module.insert(table).values(rows)
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=index_elements, set_=set_(statement.excluded)
+            )
+        )
+        return
+    for row in rows:
+        result = db.execute(
+            update(table)
+            .where(*(getattr(table, name) == row[name] for name in index_elements))
+            .values(set_(SimpleNamespace(**row)))
+        )
+        if not result.rowcount:
+            db.execute(insert(table).values(**row))
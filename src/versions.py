@@ -0,0 +1,41 @@
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from src import models, statements
+
+# record model -> collection name, one version counter per user and collection
+COLLECTIONS = {
+    models.Expense: "expenses",
+    models.Income: "incomes",
+}
+
+
+def bump(db: Session, record_model, user_id: int) -> None:
+    # runs inside the writer's transaction, so the counter only moves when
+    # the change it describes is committed
+    table = models.CollectionVersion
+    values = {
+        "user_id": user_id,
+        "collection": COLLECTIONS[record_model],
+        "version": 1,
+        "updated_at": datetime.utcnow(),
+    }
+    statements.upsert(
+        db,
+        table,
+        [values],
+        ["user_id", "collection"],
+        lambda new: {"version": table.version + 1, "updated_at": new.updated_at},
+    )
+
+
+def current(db: Session, record_model, user_id: int) -> tuple[int, datetime | None]:
+    table = models.CollectionVersion
+    row = db.execute(
+        select(table.version, table.updated_at).where(
+            table.user_id == user_id,
+            table.collection == COLLECTIONS[record_model],
+        )
+    ).first()
+    # never written, so every client copy is of the empty collection
+    return (row.version, row.updated_at) if row else (0, None)
@@ -0,0 +1,30 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# the app reads its configuration at import time, so a scratch database and
+# quiet background workers are set up before any test imports it
+_scratch = tempfile.mkdtemp(prefix="finapp-tests-")
+os.environ.setdefault("DATABASE_URI", f"sqlite:///{_scratch}/app.db")
+os.environ.setdefault("JOB_WORKERS", "0")
+os.environ.setdefault("RECURRING_SCHEDULER_SECONDS", "0")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from main import app
+
+    with TestClient(app) as client:
+        client.post(
+            "/users/register",
+            json={"username": "tester", "fullname": "Test User", "password": "pw"},
+        )
+        token = client.post(
+            "/users/token", data={"username": "tester", "password": "pw"}
+        ).json()["access_token"]
+        client.headers["Authorization"] = f"Bearer {token}"
+        yield client
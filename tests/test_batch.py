@@ -0,0 +1,21 @@
+import pytest
+
+
+@pytest.mark.parametrize("values", [{}, {"amount": None, "description": None}])
+def test_filter_update_without_values_is_refused(client, values):
+    client.post("/expenses/", json={"amount": 4, "description": "lunch"})
+    response = client.patch(
+        "/expenses/batch",
+        json={"filter": {"description_contains": "lunch"}, "set": values},
+    )
+    assert response.status_code == 422
+
+
+def test_filter_update_reports_matched_rows(client):
+    client.post("/expenses/", json={"amount": 4, "description": "dinner"})
+    response = client.patch(
+        "/expenses/batch",
+        json={"filter": {"description_contains": "dinner"}, "set": {"amount": 5}},
+    )
+    assert response.status_code == 200
+    assert response.json()["matched"] >= 1
@@ -0,0 +1,31 @@
+from src import fx
+from src.dbconfig import SessionLocal
+
+EUR = {"amount": 5, "description": "croissant", "currency": "EUR"}
+
+
+def test_currencies_without_rates_are_refused_on_write(client, tmp_path):
+    assert client.post("/expenses/", json=EUR).status_code == 422
+    imported = client.post(
+        "/expenses/bulk", json=[EUR, {"amount": 1, "description": "tea"}]
+    ).json()
+    assert imported["inserted"] == 1
+    assert imported["errors"][0]["row"] == 1
+    assert "EUR" in imported["errors"][0]["error"]
+
+    stored = client.post("/expenses/", json={"amount": 2, "description": "bun"}).json()
+    patched = client.patch(f"/expenses/{stored['id']}", json={"currency": "EUR"})
+    assert patched.status_code == 422
+    batch = client.patch(
+        "/expenses/batch",
+        json={"filter": {"ids": [stored["id"]]}, "set": {"currency": "EUR"}},
+    )
+    assert batch.status_code == 422
+    assert client.get("/reports/summary").status_code == 200
+
+    rates = tmp_path / "rates.csv"
+    rates.write_text("date,currency,rate\n2020-01-01,EUR,1.1\n")
+    with SessionLocal() as db:
+        fx.load(db, str(rates))
+    assert client.post("/expenses/", json=EUR).status_code == 201
+    assert client.get("/reports/summary").status_code == 200
@@ -0,0 +1,68 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+from src import ratelimit
+
+
+class FakeRedisRateLimit(ratelimit.RedisRateLimit):
+    # the bucket script backed by memory, noting the thread each call runs on
+    def __init__(self):
+        self.prefix = "test:"
+        self.memory = ratelimit.MemoryRateLimit()
+        self.threads = []
+        self._take = self._script
+
+    def _script(self, keys: list, args: list) -> str:
+        self.threads.append(threading.get_ident())
+        burst, rate, cost, _ = args
+        return str(self.memory.take(keys[0], cost, burst, rate))
+
+
+def _request() -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/expenses/",
+            "headers": [],
+            "client": ("203.0.113.7", 4000),
+            "route": SimpleNamespace(path="/expenses/"),
+        }
+    )
+
+
+@pytest.fixture
+def limited(monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_BURST", 2 * ratelimit.SCAN_COST)
+
+
+def _spend_burst() -> tuple[int, HTTPException]:
+    async def run():
+        await ratelimit.enforce(_request())
+        await ratelimit.enforce(_request())
+        with pytest.raises(HTTPException) as rejected:
+            await ratelimit.enforce(_request())
+        return threading.get_ident(), rejected.value
+
+    return asyncio.run(run())
+
+
+def test_redis_backend_is_called_off_the_event_loop(limited, monkeypatch):
+    backend = FakeRedisRateLimit()
+    monkeypatch.setattr(ratelimit, "buckets", backend)
+    loop_thread, rejected = _spend_burst()
+    assert rejected.status_code == 429
+    assert rejected.headers["Retry-After"] == "1"
+    assert len(backend.threads) == 3
+    assert loop_thread not in backend.threads
+
+
+def test_memory_backend_rejects_once_the_burst_is_spent(limited, monkeypatch):
+    backend = ratelimit.MemoryRateLimit()
+    monkeypatch.setattr(ratelimit, "buckets", backend)
+    _, rejected = _spend_burst()
+    assert rejected.status_code == 429
@@ -0,0 +1,116 @@
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+from src import recurring
+from src.schemas import Frequency
+
+
+def _rule(frequency, starts_at, interval=1, until=None, count=None, materialized=0):
+    return SimpleNamespace(
+        frequency=frequency,
+        interval=interval,
+        starts_at=starts_at,
+        until=until,
+        count=count,
+        materialized=materialized,
+    )
+
+
+@pytest.mark.parametrize(
+    "year, february", [(2026, datetime(2026, 2, 28)), (2028, datetime(2028, 2, 29))]
+)
+def test_month_end_clamps_without_drifting(year, february):
+    rule = _rule(Frequency.MONTHLY, datetime(year, 1, 31))
+    assert [recurring.occurrence(rule, index) for index in range(4)] == [
+        datetime(year, 1, 31),
+        february,
+        datetime(year, 3, 31),
+        datetime(year, 4, 30),
+    ]
+
+
+def test_yearly_leap_day_lands_on_february_28():
+    rule = _rule(Frequency.YEARLY, datetime(2028, 2, 29))
+    assert recurring.occurrence(rule, 1) == datetime(2029, 2, 28)
+    assert recurring.occurrence(rule, 4) == datetime(2032, 2, 29)
+
+
+@pytest.mark.parametrize(
+    "rule, start, index",
+    [
+        # every two weeks from Jan 1: Jan 29 is index 2, Feb 12 index 3
+        (
+            _rule(Frequency.WEEKLY, datetime(2026, 1, 1), interval=2),
+            datetime(2026, 2, 1),
+            3,
+        ),
+        (
+            _rule(Frequency.WEEKLY, datetime(2026, 1, 1), interval=2),
+            datetime(2026, 1, 29),
+            2,
+        ),
+        # every three months from Jan 31: Apr 30, Jul 31, Oct 31
+        (
+            _rule(Frequency.MONTHLY, datetime(2026, 1, 31), interval=3),
+            datetime(2026, 5, 1),
+            2,
+        ),
+        (
+            _rule(Frequency.MONTHLY, datetime(2026, 1, 31), interval=3),
+            datetime(2026, 4, 30),
+            1,
+        ),
+        (
+            _rule(Frequency.DAILY, datetime(2026, 1, 1, 9), interval=3),
+            datetime(2026, 1, 4, 10),
+            2,
+        ),
+        (
+            _rule(Frequency.DAILY, datetime(2026, 1, 1), interval=3),
+            datetime(2025, 1, 1),
+            0,
+        ),
+    ],
+)
+def test_first_index_is_the_first_occurrence_at_or_after_start(rule, start, index):
+    assert recurring._first_index(rule, start) == index
+    assert recurring.occurrence(rule, index) >= start
+    if index:
+        assert recurring.occurrence(rule, index - 1) < start
+
+
+def test_expand_with_interval_from_mid_window():
+    rule = _rule(Frequency.MONTHLY, datetime(2026, 1, 31), interval=3)
+    assert list(recurring.expand(rule, datetime(2026, 5, 1), datetime(2027, 5, 1))) == [
+        (2, datetime(2026, 7, 31)),
+        (3, datetime(2026, 10, 31)),
+        (4, datetime(2027, 1, 31)),
+        (5, datetime(2027, 4, 30)),
+    ]
+
+
+def test_until_on_an_occurrence_is_the_last_one():
+    rule = _rule(Frequency.WEEKLY, datetime(2026, 1, 1), until=datetime(2026, 1, 15))
+    assert recurring.occurrence(rule, 2) == datetime(2026, 1, 15)
+    assert recurring.occurrence(rule, 3) is None
+    assert list(recurring.expand(rule, datetime(2026, 1, 1), datetime(2027, 1, 1))) == [
+        (0, datetime(2026, 1, 1)),
+        (1, datetime(2026, 1, 8)),
+        (2, datetime(2026, 1, 15)),
+    ]
+
+
+def test_count_ends_the_schedule():
+    rule = _rule(Frequency.DAILY, datetime(2026, 1, 1), count=2)
+    assert recurring.occurrence(rule, 1) == datetime(2026, 1, 2)
+    assert recurring.occurrence(rule, 2) is None
+
+
+def test_expand_skips_materialized_occurrences():
+    rule = _rule(Frequency.WEEKLY, datetime(2026, 1, 1), materialized=2)
+    assert list(
+        recurring.expand(rule, datetime(2026, 1, 1), datetime(2026, 1, 29))
+    ) == [
+        (2, datetime(2026, 1, 15)),
+        (3, datetime(2026, 1, 22)),
+    ]